@@ -1,10 +1,25 @@
-import requests
 import json
-from typing import Callable, Optional
-from config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL
+from typing import Callable, Iterator, Optional
+from config import DEEPSEEK_API_KEY, DEEPSEEK_API_URL, RETRIEVAL_TOP_K, PROMPT_TOKEN_BUDGET
+from http_client import get_http_client
+from llm_cache import get_llm_cache
+from retrieval import RetrievalIndex, pack_records, estimate_tokens
+from patient_index import PatientIndex
+from profiling import span
 from data_analyzer import DataAnalyzer  # 导入 DataAnalyzer
 
 class APIHandler:
+    # 统计/汇总类问题的关键词
+    AGGREGATE_KEYWORDS = (
+        '最常见', '最多', '最少', '多少', '几种', '几类', '平均', '均值', '中位数',
+        '最大', '最小', '最高', '最低', '比例', '占比', '百分比', '分布', '统计',
+        '总数', '总共', '频率', '频次', '排名', '前十', '相关', '异常值', '标准差', '范围'
+    )
+    # 指向单个患者/记录的表述，这类问题需要原始记录
+    SINGLE_RECORD_KEYWORDS = ('该患者', '这个患者', '这位患者', '某患者', '这条记录', '该记录')
+    # 汇总上下文中保留的最强相关变量对数
+    TOP_CORRELATION_PAIRS = 10
+
     @staticmethod
     def call_deepseek_api(prompt: str, stream_callback: Optional[Callable] = None) -> str:
         """调用DeepSeek API，支持流式输出"""
@@ -48,7 +63,9 @@ class APIHandler:
             return f"数据分析失败: {str(e)}"
 
     @staticmethod
-    def analyze_data_question(question: str, data: dict) -> str:
+    def analyze_data_question(question: str, data: dict, index: Optional[RetrievalIndex] = None,
+                              analysis_results: Optional[dict] = None,
+                              patient_index: Optional[PatientIndex] = None) -> str:
         """分析数据相关问题"""
         headers = {
             "Content-Type": "application/json",
@@ -56,7 +73,7 @@ class APIHandler:
         }
         
         # 构建请求数据
-        prompt = f"问题：{question}\n数据：{json.dumps(data, ensure_ascii=False)}\n请分析并回答："
+        prompt = APIHandler._build_question_prompt(question, data, index, analysis_results, patient_index)
         data_payload = {
             "model": "deepseek-chat",
             "messages": [{"role": "user", "content": prompt}],
@@ -64,19 +81,182 @@ class APIHandler:
         }
         
         try:
-            response = requests.post(DEEPSEEK_API_URL, headers=headers, json=data_payload)
-            response.raise_for_status()  # 检查请求是否成功
-            
-            result = response.json()
-            # 确保解包的内容符合预期
-            if 'choices' in result and len(result['choices']) > 0:
-                answer = result['choices'][0]['message']['content']
-                return answer
-            else:
-                raise ValueError("响应中没有可用的选择")
+            with span('llm.analyze_data_question', token_counter=estimate_tokens) as call:
+                call.record_prompt(prompt)
+                
+                # 相同问题直接返回缓存的回答
+                cache = get_llm_cache()
+                cache_key = cache.make_key(data_payload) if cache else None
+                if cache:
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        call.set(cache_hit=True)
+                        return cached
+                
+                response = get_http_client().post(DEEPSEEK_API_URL, headers=headers, json=data_payload)
+                response.raise_for_status()  # 检查请求是否成功
+                
+                result = response.json()
+                # 确保解包的内容符合预期
+                if 'choices' in result and len(result['choices']) > 0:
+                    answer = result['choices'][0]['message']['content']
+                    call.record_output(answer)
+                    # 空回答不缓存
+                    if cache and answer:
+                        cache.put(cache_key, answer)
+                    return answer
+                else:
+                    raise ValueError("响应中没有可用的选择")
+        except Exception as e:
+            raise Exception(f"分析数据问题失败: {str(e)}")
+
+    @staticmethod
+    def stream_data_question(question: str, data: dict, index: Optional[RetrievalIndex] = None,
+                             analysis_results: Optional[dict] = None,
+                             patient_index: Optional[PatientIndex] = None) -> Iterator[str]:
+        """流式分析数据相关问题，逐段产出回答内容（可直接用于st.write_stream）"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
+        }
+        
+        prompt = APIHandler._build_question_prompt(question, data, index, analysis_results, patient_index)
+        data_payload = {
+            "model": "deepseek-chat",
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": True
+        }
+        
+        try:
+            # 记录首字延迟与生成速度
+            with span('llm.stream_data_question', token_counter=estimate_tokens) as call:
+                call.record_prompt(prompt)
+                
+                # 命中缓存时回放完整回答
+                cache = get_llm_cache()
+                cache_key = cache.make_key(data_payload) if cache else None
+                if cache:
+                    cached = cache.get(cache_key)
+                    if cached is not None:
+                        call.set(cache_hit=True)
+                        yield from cache.replay(cached)
+                        return
+                
+                full_response = ""
+                status = {}
+                with get_http_client().post(DEEPSEEK_API_URL, headers=headers, json=data_payload,
+                                            stream=True) as response:
+                    for content in APIHandler._iter_sse_content(response, status):
+                        call.record_chunk(content)
+                        full_response += content
+                        yield content
+                
+                # 仅缓存完整接收（收到结束标记）且非空的回答，连接中断时的截断回答不缓存
+                if cache and status['complete'] and full_response:
+                    cache.put(cache_key, full_response)
         except Exception as e:
             raise Exception(f"分析数据问题失败: {str(e)}")
 
+    @staticmethod
+    def _build_question_prompt(question: str, data, index: Optional[RetrievalIndex] = None,
+                               analysis_results: Optional[dict] = None,
+                               patient_index: Optional[PatientIndex] = None) -> str:
+        """构建问答提示词：提到患者标识的问题使用该患者的时间线，统计类问题使用预计算的汇总结果，其余问题检索最相关的记录"""
+        patient_key = patient_index.find_key(question) if patient_index is not None else None
+        if patient_key is not None:
+            # 只读取该患者的记录；超出预算时保留最近的记录
+            records = patient_index.timeline(patient_key)
+            context, packed_count = pack_records(reversed(records), PROMPT_TOKEN_BUDGET)
+            return (f"问题：{question}\n"
+                    f"患者{patient_key}的病历时间线（共{len(records)}条记录，以下为按日期倒序的最近{packed_count}条）：{context}\n"
+                    f"请结合病情的时间变化分析并回答：")
+
+        if analysis_results and APIHandler._is_aggregate_question(question):
+            context = APIHandler._build_summary_context(question, analysis_results, PROMPT_TOKEN_BUDGET)
+            return (f"问题：{question}\n"
+                    f"数据汇总统计（基于全部{len(data)}条记录预先计算）：{context}\n"
+                    f"请根据以上统计结果分析并回答：")
+
+        if index is None:
+            index = RetrievalIndex(data)
+        records = index.top_records(question, RETRIEVAL_TOP_K)
+        context, packed_count = pack_records(records, PROMPT_TOKEN_BUDGET)
+        return (f"问题：{question}\n"
+                f"数据（共{len(data)}条记录，以下为与问题最相关的{packed_count}条）：{context}\n"
+                f"请分析并回答：")
+
+    @staticmethod
+    def _is_aggregate_question(question: str) -> bool:
+        """判断是否为可由汇总统计回答的问题"""
+        if any(keyword in question for keyword in APIHandler.SINGLE_RECORD_KEYWORDS):
+            return False
+        return any(keyword in question for keyword in APIHandler.AGGREGATE_KEYWORDS)
+
+    @staticmethod
+    def _build_summary_context(question: str, analysis_results: dict, token_budget: int) -> str:
+        """从分析结果中挑选与问题相关的汇总统计，按相关程度依次加入直到达到token预算"""
+        numeric = analysis_results.get('numeric_analysis', {})
+        text = analysis_results.get('text_analysis', {})
+        diagnosis = analysis_results.get('diagnosis_analysis', {})
+
+        def mentioned(columns):
+            # 问题中提到的列优先，未提到任何列时保留全部
+            columns = list(columns)
+            selected = [column for column in columns if column in question]
+            return selected or columns
+
+        stats_columns = mentioned(numeric.get('basic_stats', {}))
+        text_columns = mentioned(text.get('unique_values', {}))
+
+        sections = []
+        if any(word in question for word in ('诊断', '病理', '疾病')):
+            sections.append(('诊断频率（前10）', diagnosis.get('diagnosis_freq')))
+            sections.append(('诊断词频（前20）', diagnosis.get('diagnosis_words')))
+        if '相关' in question:
+            sections.append(('相关性最强的变量对', APIHandler._top_correlations(
+                numeric.get('correlation', {}), stats_columns)))
+        if '异常' in question:
+            sections.append(('异常值统计', {column: numeric['outliers'][column]
+                                        for column in stats_columns if column in numeric.get('outliers', {})}))
+        sections.append(('数值变量描述统计', {column: numeric['basic_stats'][column] for column in stats_columns}))
+        sections.append(('文本字段取值统计', {column: text['unique_values'][column] for column in text_columns}))
+        sections.append(('诊断频率（前10）', diagnosis.get('diagnosis_freq')))
+
+        context = {}
+        used_tokens = 0
+        for title, section in sections:
+            if not section or title in context:
+                continue
+            section = APIHandler._round_floats(section)
+            cost = estimate_tokens(json.dumps({title: section}, ensure_ascii=False, default=str))
+            if used_tokens + cost > token_budget:
+                continue
+            context[title] = section
+            used_tokens += cost
+        return json.dumps(context, ensure_ascii=False, default=str)
+
+    @staticmethod
+    def _top_correlations(correlation: dict, columns: list) -> dict:
+        """返回给定列中绝对值最大的若干相关系数"""
+        pairs = {}
+        for column in columns:
+            for other, value in correlation.get(column, {}).items():
+                if other == column or value is None or value != value:
+                    continue
+                key = ' - '.join(sorted((column, other)))
+                pairs[key] = value
+        top = sorted(pairs.items(), key=lambda item: abs(item[1]), reverse=True)
+        return dict(top[:APIHandler.TOP_CORRELATION_PAIRS])
+
+    @staticmethod
+    def _round_floats(value, digits: int = 4):
+        """递归地保留有效数字，压缩汇总上下文"""
+        if isinstance(value, dict):
+            return {k: APIHandler._round_floats(v, digits) for k, v in value.items()}
+        if isinstance(value, float):
+            return float(f"{value:.{digits}g}")
+        return value
+
     @staticmethod
     def _generate_analysis_prompt(prompt: str) -> str:
         """生成分析提示词"""
@@ -147,21 +327,109 @@ class APIHandler:
             "stream": True  # 如果支持流式输出
         }
         
-        with requests.post(DEEPSEEK_API_URL, headers=headers, json=data, stream=True) as response:
-            response.raise_for_status()  # 检查请求是否成功
-            full_response = ""
+        with span('llm.request', token_counter=estimate_tokens) as call:
+            call.record_prompt(prompt)
+            
+            # 相同提示词直接回放缓存的响应
+            cache = get_llm_cache()
+            cache_key = cache.make_key(data) if cache else None
+            if cache:
+                cached = cache.get(cache_key)
+                if cached is not None:
+                    call.set(cache_hit=True)
+                    if stream_callback:
+                        for content in cache.replay(cached):
+                            stream_callback(content)
+                    return cached
+            
+            with get_http_client().post(DEEPSEEK_API_URL, headers=headers, json=data, stream=True) as response:
+                response.raise_for_status()  # 检查请求是否成功
+                full_response = ""
+                status = {}
+                
+                for content in APIHandler._iter_sse_content(response, status):
+                    call.record_chunk(content)
+                    full_response += content
+                    if stream_callback:
+                        stream_callback(content)
+                
+                # 仅缓存完整接收且非空的响应
+                if cache and status['complete'] and full_response:
+                    cache.put(cache_key, full_response)
+                return full_response
+
+    @staticmethod
+    def _iter_sse_content(response, status: Optional[dict] = None) -> Iterator[str]:
+        """解析SSE事件流，逐段产出增量内容；支持多行data事件和[DONE]结束标记
+
+        每个data行能单独解析为完整JSON时立即产出，不等待空行，兼容不以空行分隔事件的服务端；
+        只有无法单独解析的行才作为多行事件的续行暂存。
+        传入status字典时，收到[DONE]或finish_reason后将status['complete']置为True，供调用方判断回答是否完整。
+        """
+        if status is None:
+            status = {}
+        status['complete'] = False
+        data_lines = []  # 尚未拼成完整JSON的多行事件
+        for line in response.iter_lines():
+            line = line.decode('utf-8') if isinstance(line, bytes) else line
             
-            for line in response.iter_lines():
-                if line:
-                    try:
-                        json_response = json.loads(line.decode('utf-8').replace('data: ', ''))
-                        if 'choices' in json_response and len(json_response['choices']) > 0:
-                            content = json_response['choices'][0].get('delta', {}).get('content', '')
-                            if content:
-                                full_response += content
-                                if stream_callback:
-                                    stream_callback(content)
-                    except json.JSONDecodeError:
-                        continue
+            # 空行表示一个事件结束
+            if not line:
+                if data_lines:
+                    yield from APIHandler._parse_sse_lines(data_lines, status)
+                    data_lines = []
+                continue
             
-            return full_response
\ No newline at end of file
+            # 以冒号开头的是注释/心跳
+            if line.startswith(':'):
+                continue
+            
+            field, _, value = line.partition(':')
+            if field != 'data':
+                continue
+            value = value[1:] if value.startswith(' ') else value
+            
+            # 结束标记按行判断，之前暂存的内容先行产出
+            if value.strip() == '[DONE]':
+                yield from APIHandler._parse_sse_lines(data_lines, status)
+                status['complete'] = True
+                return
+            
+            payload = APIHandler._load_json('\n'.join(data_lines + [value]))
+            if payload is None:
+                data_lines.append(value)
+            else:
+                data_lines = []
+                yield from APIHandler._payload_content(payload, status)
+        
+        # 处理未以空行结尾的最后一个事件
+        yield from APIHandler._parse_sse_lines(data_lines, status)
+
+    @staticmethod
+    def _load_json(text: str):
+        """解析JSON，不完整或无法解析时返回None"""
+        try:
+            return json.loads(text)
+        except json.JSONDecodeError:
+            return None
+
+    @staticmethod
+    def _parse_sse_lines(data_lines: list, status: dict) -> Iterator[str]:
+        """解析暂存的data行：拼接后仍无法解析时按行逐个解析，跳过无效行"""
+        if not data_lines:
+            return
+        payload = APIHandler._load_json('\n'.join(data_lines))
+        payloads = [payload] if payload is not None else [APIHandler._load_json(data_line) for data_line in data_lines]
+        for payload in payloads:
+            if payload is not None:
+                yield from APIHandler._payload_content(payload, status)
+
+    @staticmethod
+    def _payload_content(json_response, status: dict) -> Iterator[str]:
+        """从一个增量响应中取出内容，并记录是否收到finish_reason"""
+        if isinstance(json_response, dict) and json_response.get('choices'):
+            if json_response['choices'][0].get('finish_reason'):
+                status['complete'] = True
+            content = json_response['choices'][0].get('delta', {}).get('content', '')
+            if content:
+                yield content
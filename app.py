@@ -1,11 +1,14 @@
 import streamlit as st
 import pandas as pd
 import json
-from data_processor import DataProcessor
-from data_analyzer import DataAnalyzer
 from data_visualization import DataVisualizer
 from api_handler import APIHandler
-import os
+from result_cache import ResultCache
+from dataset_store import DatasetStore
+from job_queue import JobQueue, STAGE_LABELS, PENDING_STATUSES
+from profiling import get_profiler
+from config import RESULT_CACHE_MAX_MB, RESULT_CACHE_DIR, JOB_POLL_SECONDS
+import uuid
 
 # 设置页面配置
 st.set_page_config(
@@ -33,15 +36,31 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+@st.cache_resource
+def get_dataset_store():
+    """进程级共享数据集存储，跨脚本重跑和会话共享，同一数据集只保存一份"""
+    return DatasetStore(ResultCache(RESULT_CACHE_MAX_MB * 1024 * 1024, RESULT_CACHE_DIR))
+
+@st.cache_resource
+def get_job_queue():
+    """进程级共享的后台任务队列，上传文件在工作进程中处理，不占用脚本线程"""
+    return JobQueue()
+
 class MedicalDataApp:
     def __init__(self):
-        self.data_processor = DataProcessor()
-        self.data_analyzer = DataAnalyzer()
         self.data_visualizer = DataVisualizer()
         self.api_handler = APIHandler()
         self.processed_data = None
         self.analysis_results = None
         self.visualizations = None
+        self.retrieval_index = None
+        self.patient_index = None
+        self.dataset_store = get_dataset_store()
+        self.job_queue = get_job_queue()
+        # 会话只保存会话标识和数据集键，数据本身由共享存储持有
+        if 'session_id' not in st.session_state:
+            st.session_state.session_id = uuid.uuid4().hex
+        self.session_id = st.session_state.session_id
     
     def run(self):
         """运行应用"""
@@ -52,42 +71,101 @@ class MedicalDataApp:
             st.header("📊 数据上传")
             uploaded_file = st.file_uploader("选择数据文件", type=['csv', 'json'])
             
+            # 任务ID保存在地址栏参数中，刷新页面后上传控件为空，仍可按任务ID恢复
             if uploaded_file:
-                with st.spinner("正在处理数据..."):
-                    try:
-                        # 保存上传的文件
-                        file_path = f"temp_{uploaded_file.name}"
-                        with open(file_path, "wb") as f:
-                            f.write(uploaded_file.getvalue())
-                        
-                        # 处理数据
-                        self.processed_data = self.data_processor.process_data(file_path)
-                        
-                        # 分析数据
-                        self.analysis_results = self.data_analyzer.analyze_data(
-                            self.processed_data['json1'],
-                            self.processed_data['json2']
-                        )
-                        
-                        # 创建可视化
-                        self.visualizations = self.data_visualizer.create_all_visualizations(
-                            self.processed_data['json1'],
-                            self.processed_data['json2']
-                        )
-                        
-                        st.success("数据处理完成！")
-                        
-                        # 删除临时文件
-                        os.remove(file_path)
-                    except Exception as e:
-                        st.error(f"数据处理失败: {str(e)}")
-        
-        # 主界面
-        if self.processed_data:
+                st.query_params['job'] = self._get_upload_job(uploaded_file)
+            elif st.session_state.pop('upload_job', None) is not None:
+                # 本会话中移除了上传文件（而非刷新页面），不再恢复该任务
+                st.query_params.pop('job', None)
+            job_id = st.query_params.get('job')
+            job_pending = False
+            
+            if job_id:
+                job_pending = self._load_job(job_id)
+            else:
+                # 移除上传文件后释放对数据集的占用
+                self.dataset_store.release(self.session_id)
+        
+            # 性能剖析面板（需设置 PROFILING_ENABLED=true）
+            show_profiling = get_profiler().enabled and st.checkbox("显示性能剖析")
+        
+        # 主界面：任务处理中时只定时刷新进度面板，完成后展示全部结果
+        if job_pending:
+            self._display_job_progress(job_id)
+        elif self.processed_data:
             self._display_data_overview()
             self._display_analysis_results()
             self._display_visualizations()
             self._display_chat_interface()
+        
+        if show_profiling:
+            self._display_profiling_panel()
+    
+    def _load_job(self, job_id):
+        """按任务状态加载数据集，返回任务是否仍在处理中"""
+        job = self.job_queue.get(job_id)
+        if job is None:
+            st.warning("任务不存在或已过期，请重新上传数据文件")
+            del st.query_params['job']
+            self.dataset_store.release(self.session_id)
+            return False
+        
+        dataset = self.dataset_store.acquire(job['dataset_key'], self.session_id)
+        if dataset is None and job['status'] == 'done':
+            try:
+                # 多个会话同时打开同一任务时只读取一次结果文件；以结果文件大小计入缓存预算，无需再次序列化
+                dataset = self.dataset_store.acquire_or_build(
+                    job['dataset_key'], self.session_id, lambda: self.job_queue.load_result(job_id),
+                    self.job_queue.result_size(job_id)
+                )
+            except Exception as e:
+                st.error(str(e))
+                return False
+        
+        if dataset is not None:
+            # 同一数据集在所有会话间共享同一份结果
+            self.processed_data = dataset['processed_data']
+            self.analysis_results = dataset['analysis_results']
+            self.visualizations = dataset['visualizations']
+            self.retrieval_index = dataset['retrieval_index']
+            self.patient_index = dataset['patient_index']
+            st.caption(f"{job['file_name']} · 该数据集当前由 {self.dataset_store.refcount(job['dataset_key'])} 个会话共享")
+            return False
+        
+        if job['status'] == 'failed':
+            st.error(f"数据处理失败: {job['error']}")
+            return False
+        
+        st.caption(f"{job['file_name']} · 处理中")
+        return True
+    
+    @st.fragment(run_every=JOB_POLL_SECONDS)
+    def _display_job_progress(self, job_id):
+        """任务进度面板：只重跑该片段以刷新阶段进度，已完成阶段的部分结果（概览、分析结果）先行展示"""
+        job = self.job_queue.get(job_id)
+        if job is None or job['status'] not in PENDING_STATUSES:
+            # 任务结束后整页重跑，加载完整结果或显示错误
+            st.rerun()
+        
+        stage = STAGE_LABELS.get(job['stage'], '排队中')
+        st.progress(job['progress'], text=f"{job['file_name']} · {stage}（{job['completed']}/{len(STAGE_LABELS)}）")
+        self.processed_data = job['partial'].get('processed_data')
+        self.analysis_results = job['partial'].get('analysis_results')
+        if self.processed_data:
+            self._display_data_overview()
+        if self.analysis_results:
+            self._display_analysis_results()
+    
+    def _get_upload_job(self, uploaded_file):
+        """为上传文件提交处理任务（按内容哈希去重），同一上传在会话内只提交一次"""
+        file_id = getattr(uploaded_file, 'file_id', None) or (uploaded_file.name, uploaded_file.size)
+        upload_job = st.session_state.get('upload_job')
+        if upload_job is None or upload_job[0] != file_id:
+            data = uploaded_file.getvalue()
+            job_id = self.job_queue.submit(ResultCache.content_key(data), uploaded_file.name, data)
+            upload_job = (file_id, job_id)
+            st.session_state.upload_job = upload_job
+        return upload_job[1]
     
     def _display_data_overview(self):
         """显示数据概览"""
@@ -102,6 +180,10 @@ class MedicalDataApp:
         with col2:
             st.subheader("诊断信息")
             st.json(self.processed_data['json2'][0])
+        
+        if self.patient_index is not None:
+            st.caption(f"共 {len(self.processed_data['json2'])} 条记录，{len(self.patient_index)} 位患者；"
+                       f"问题中附上患者标识即可基于该患者的全部记录回答")
     
     def _display_analysis_results(self):
         """显示分析结果"""
@@ -126,24 +208,73 @@ class MedicalDataApp:
             st.json(self.analysis_results['temporal_analysis'])
     
     def _display_visualizations(self):
-        """显示可视化结果"""
+        """显示可视化结果（只构建当前选中类别的图表）"""
         st.header("📊 数据可视化")
         
+        section = st.radio(
+            "选择图表类别",
+            ["数值型数据分布", "诊断数据分布", "时间趋势分析", "数值与诊断对比"],
+            horizontal=True
+        )
+        
         # 数值型数据可视化
-        st.subheader("数值型数据分布")
-        st.plotly_chart(self.visualizations['numeric']['box_plot'])
-        st.plotly_chart(self.visualizations['numeric']['histogram'])
-        st.plotly_chart(self.visualizations['numeric']['heatmap'])
+        if section == "数值型数据分布":
+            for fig in self.visualizations['numeric'].values():
+                st.plotly_chart(fig)
         
         # 诊断数据可视化
-        st.subheader("诊断数据分布")
-        st.plotly_chart(self.visualizations['diagnosis']['diagnosis_bar'])
-        st.plotly_chart(self.visualizations['diagnosis']['wordcloud'])
+        elif section == "诊断数据分布":
+            diagnosis_figures = self.visualizations['diagnosis']
+            if 'diagnosis_bar' in diagnosis_figures:
+                st.plotly_chart(diagnosis_figures['diagnosis_bar'])
+            if st.toggle("显示诊断词云") and 'wordcloud' in diagnosis_figures:
+                st.plotly_chart(diagnosis_figures['wordcloud'])
         
         # 时间序列可视化
-        st.subheader("时间趋势分析")
-        for fig in self.visualizations['temporal'].values():
-            st.plotly_chart(fig)
+        elif section == "时间趋势分析":
+            for fig in self.visualizations['temporal'].values():
+                st.plotly_chart(fig)
+        
+        # 数值型变量与诊断的对比（每次只构建选中的变量）
+        else:
+            comparison_figures = self.visualizations['comparison']
+            if comparison_figures:
+                name = st.selectbox(
+                    "选择数值变量",
+                    list(comparison_figures),
+                    format_func=lambda key: key.replace('comparison_', '', 1)
+                )
+                st.plotly_chart(comparison_figures[name])
+            else:
+                st.info("没有可用于对比的诊断数据")
+    
+    def _display_profiling_panel(self):
+        """显示性能剖析面板：按调用链查看各阶段瀑布图，并导出JSON Lines / Prometheus格式"""
+        st.header("⏱️ 性能剖析")
+        profiler = get_profiler()
+        traces = profiler.traces()
+        if not traces:
+            st.info("暂无剖析记录")
+            return
+        
+        trace = st.selectbox(
+            "选择调用链",
+            traces,
+            format_func=lambda spans: f"{spans[0]['name']} · {pd.Timestamp(spans[0]['started_at'], unit='s'):%H:%M:%S}"
+                                      f" · {max(record['wall_seconds'] for record in spans):.2f}s"
+        )
+        st.plotly_chart(self.data_visualizer.create_waterfall(trace))
+        st.dataframe(pd.DataFrame(trace).drop(columns=['trace_id']))
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button(
+                "导出 JSON Lines",
+                '\n'.join(json.dumps(record, ensure_ascii=False, default=str) for trace in traces for record in trace),
+                file_name='profile.jsonl'
+            )
+        with col2:
+            st.download_button("导出 Prometheus 指标", profiler.prometheus_text(), file_name='metrics.prom')
     
     def _display_chat_interface(self):
         """显示聊天界面"""
@@ -167,20 +298,21 @@ class MedicalDataApp:
             with st.chat_message("user"):
                 st.write(prompt)
             
-            # 生成回答
+            # 生成回答（流式输出）
             with st.chat_message("assistant"):
-                with st.spinner("正在思考..."):
-                    try:
-                        # 调用 API 处理问题
-                        answer = self.api_handler.analyze_data_question(
-                            prompt,
-                            self.processed_data['json2']  # 使用 json2 作为数据源
-                        )
-                        
-                        st.write(answer)  # 直接显示回答
-                        st.session_state.chat_history.append({"role": "assistant", "content": answer})
-                    except Exception as e:
-                        st.error(f"生成回答失败: {str(e)}")
+                try:
+                    # 调用 API 处理问题，逐段显示回答
+                    answer = st.write_stream(self.api_handler.stream_data_question(
+                        prompt,
+                        self.processed_data['json2'],  # 使用 json2 作为数据源
+                        self.retrieval_index,
+                        self.analysis_results,  # 统计类问题使用预计算的汇总结果
+                        self.patient_index  # 提到患者标识的问题使用该患者的时间线
+                    ))
+                    
+                    st.session_state.chat_history.append({"role": "assistant", "content": answer})
+                except Exception as e:
+                    st.error(f"生成回答失败: {str(e)}")
 
 if __name__ == "__main__":
     app = MedicalDataApp()
@@ -0,0 +1,150 @@
+import json
+import os
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from typing import Callable, Iterator, Optional
+from config import DEEPSEEK_API_KEY, BATCH_MAX_WORKERS, BATCH_TOKENS_PER_MINUTE, BATCH_MAX_OUTPUT_TOKENS
+from api_handler import APIHandler
+from retrieval import estimate_tokens
+from patient_index import get_patient_index
+
+
+class TokenRateLimiter:
+    """令牌桶限速器：限制每分钟发送给模型的token数（0表示不限速）"""
+
+    def __init__(self, tokens_per_minute):
+        self.capacity = tokens_per_minute
+        self.rate = tokens_per_minute / 60.0
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens):
+        """阻塞直到桶中有足够的token"""
+        if self.capacity <= 0:
+            return
+        tokens = min(tokens, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= tokens:
+                    self.available -= tokens
+                    return
+                wait_seconds = (tokens - self.available) / self.rate
+            time.sleep(wait_seconds)
+
+
+class BatchReportEngine:
+    """批量患者报告生成：并发执行“分析→报告”两阶段调用，失败相互隔离，支持断点续跑"""
+
+    def __init__(self, max_workers=BATCH_MAX_WORKERS, tokens_per_minute=BATCH_TOKENS_PER_MINUTE,
+                 checkpoint_path=None):
+        self.max_workers = max_workers
+        self.rate_limiter = TokenRateLimiter(tokens_per_minute)
+        self.checkpoint_path = checkpoint_path
+        self._checkpoint_lock = threading.Lock()
+
+    def run(self, patients, progress_callback: Optional[Callable] = None) -> Iterator[dict]:
+        """按完成顺序逐个产出患者报告结果
+
+        patients 为 {患者标识: 患者数据} 字典或 (患者标识, 患者数据) 序列；
+        检查点中已成功的患者会被跳过，失败的患者会在续跑时重试。
+        """
+        items = patients.items() if isinstance(patients, Mapping) else patients
+        completed_ids = self._load_completed_ids()
+        pending = ((str(patient_id), data) for patient_id, data in items
+                   if str(patient_id) not in completed_ids)
+
+        finished = 0
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight = set()
+            # 滑动窗口提交任务，避免一次性为上千名患者创建任务
+            for patient_id, data in pending:
+                in_flight.add(executor.submit(self._generate_report, patient_id, data))
+                if len(in_flight) >= self.max_workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        finished += 1
+                        yield self._finish(future.result(), finished, progress_callback)
+            for future in as_completed(in_flight):
+                finished += 1
+                yield self._finish(future.result(), finished, progress_callback)
+
+    def run_dataset(self, json1, json2, progress_callback: Optional[Callable] = None) -> Iterator[dict]:
+        """按患者分组批量生成报告，每位患者按日期排序的全部记录作为报告输入"""
+        patient_index = get_patient_index(json1, json2)
+        if patient_index is None:
+            raise Exception("数据中没有患者标识列，请配置PATIENT_KEY_SALT后重新处理数据")
+        return self.run(patient_index.timelines(), progress_callback)
+
+    def _finish(self, result, finished, progress_callback):
+        self._append_checkpoint(result)
+        if progress_callback:
+            progress_callback(finished, result)
+        return result
+
+    def _generate_report(self, patient_id, data):
+        """为单个患者生成报告，异常只记录在该患者的结果中"""
+        headers = {
+            "Content-Type": "application/json",
+            "Authorization": f"Bearer {DEEPSEEK_API_KEY}"
+        }
+        start = time.perf_counter()
+        try:
+            patient_text = data if isinstance(data, str) else json.dumps(data, ensure_ascii=False, default=str)
+
+            # 思维链分析
+            analysis_prompt = APIHandler._generate_analysis_prompt(patient_text)
+            self.rate_limiter.acquire(estimate_tokens(analysis_prompt) + BATCH_MAX_OUTPUT_TOKENS)
+            analysis_result = APIHandler._make_api_request(analysis_prompt, headers)
+
+            # 生成诊断报告
+            report_prompt = APIHandler._generate_report_prompt(analysis_result)
+            self.rate_limiter.acquire(estimate_tokens(report_prompt) + BATCH_MAX_OUTPUT_TOKENS)
+            report_result = APIHandler._make_api_request(report_prompt, headers)
+
+            return {
+                'patient_id': patient_id,
+                'status': 'success',
+                'report': report_result,
+                'elapsed': time.perf_counter() - start
+            }
+        except Exception as e:
+            return {
+                'patient_id': patient_id,
+                'status': 'failed',
+                'error': str(e),
+                'elapsed': time.perf_counter() - start
+            }
+
+    def _load_completed_ids(self):
+        """读取检查点中已成功完成的患者"""
+        return {result['patient_id'] for result in self.load_results(self.checkpoint_path)
+                if result.get('status') == 'success'}
+
+    def _append_checkpoint(self, result):
+        if not self.checkpoint_path:
+            return
+        with self._checkpoint_lock:
+            with open(self.checkpoint_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(result, ensure_ascii=False) + '\n')
+                f.flush()
+
+    @staticmethod
+    def load_results(checkpoint_path):
+        """读取检查点文件中的全部结果（忽略中断时写了一半的行）"""
+        if not checkpoint_path or not os.path.exists(checkpoint_path):
+            return []
+        results = []
+        with open(checkpoint_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    results.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return results
+
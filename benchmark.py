@@ -0,0 +1,680 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import api_handler
+import data_processor
+import llm_cache
+import profiling
+from data_processor import DataProcessor
+from data_analyzer import DataAnalyzer
+from data_visualization import DataVisualizer
+from api_handler import APIHandler
+from retrieval import RetrievalIndex, estimate_tokens
+from diagnosis_terms import DiagnosisTermIndex
+from temporal import build_time_indexes
+from mock_server import MockCompletionServer
+
+# 合成数据使用的诊断取值
+DIAGNOSES = ['肺腺癌', '肺鳞癌', '小细胞肺癌', '乳腺浸润性导管癌', '胃腺癌',
+             '结肠腺癌，淋巴结转移', '肝细胞癌', '良性病变', '慢性炎症', '甲状腺乳头状癌']
+
+
+def make_synthetic_frame(rows, numeric_cols=20, text_cols=5, nan_ratio=0.1, seed=0):
+    """生成带缺失值的合成数据表"""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(numeric_cols):
+        values = rng.normal(100, 15, rows)
+        values[rng.random(rows) < nan_ratio] = np.nan
+        data[f'检验指标{i + 1}'] = values
+    for i in range(text_cols):
+        values = rng.choice(DIAGNOSES, rows).astype(object)
+        values[rng.random(rows) < nan_ratio] = None
+        data[f'文本字段{i + 1}'] = values
+    data['病理诊断（病案首页）'] = rng.choice(DIAGNOSES, rows)
+    return pd.DataFrame(data)
+
+
+def _timed(func, *args):
+    """执行函数并返回（结果，耗时秒数）"""
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+# 以下为逐条记录的原始处理实现，仅作基准对照
+def clean_nan_in_json(data):
+    """递归地从字典中去除NaN值，但保留列结构"""
+    if isinstance(data, dict):
+        return {k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in data.items()}
+    elif isinstance(data, list):
+        return [clean_nan_in_json(item) for item in data]
+    else:
+        return data
+
+
+def remove_none_values(data):
+    """去除值为None的键值对"""
+    if isinstance(data, dict):
+        return {k: v for k, v in data.items() if v is not None}
+    elif isinstance(data, list):
+        return [remove_none_values(item) for item in data]
+    else:
+        return data
+
+
+def separate_data(data):
+    """根据值的类型将数据分为json1和json2"""
+    json1 = []
+    json2 = []
+    for record in data:
+        record_json1 = {}
+        record_json2 = {}
+        for key, value in record.items():
+            if isinstance(value, (int, float)) or isinstance(value, bool):
+                record_json1[key] = value
+            else:
+                record_json2[key] = value
+        json1.append(record_json1)
+        json2.append(record_json2)
+    return json1, json2
+
+
+def prepare_for_model_summary(data):
+    """将json2转换为适合大模型汇总的格式"""
+    model_summary_data = []
+    for record in data:
+        summary_record = {}
+        for key, value in record.items():
+            summary_record[key] = value
+        model_summary_data.append(summary_record)
+    return model_summary_data
+
+
+def legacy_process_frame(df):
+    """逐条记录的原始处理流程，作为基准对照"""
+    json_dict = df.to_dict(orient='records')
+    cleaned_dict = [clean_nan_in_json(record) for record in json_dict]
+    cleaned_dict_no_none = [remove_none_values(record) for record in cleaned_dict]
+    json1, json2 = separate_data(cleaned_dict_no_none)
+    model_summary_data = prepare_for_model_summary(json2)
+    return {'json1': json1, 'json2': json2, 'model_summary_data': model_summary_data}
+
+
+def bench_process(args):
+    """对比逐条记录流程与列式流程的处理耗时"""
+    df = make_synthetic_frame(args.rows, args.numeric_cols, args.text_cols)
+    processor = DataProcessor()
+    print(f"合成数据: {args.rows} 行 × {df.shape[1]} 列")
+
+    _, legacy_time = _timed(legacy_process_frame, df)
+    print(f"逐条记录流程: {legacy_time:.2f}s")
+
+    result, columnar_time = _timed(processor._process_frame, df)
+    print(f"列式流程: {columnar_time:.4f}s (加速 {legacy_time / max(columnar_time, 1e-9):.0f}x)")
+
+    # 按需生成全部字典记录的开销（仅在消费者需要时发生）
+    _, materialize_time = _timed(lambda: (result['json1'].to_list(), result['json2'].to_list()))
+    print(f"列式流程 + 全量生成记录: {columnar_time + materialize_time:.2f}s "
+          f"(加速 {legacy_time / max(columnar_time + materialize_time, 1e-9):.1f}x)")
+
+    # 低基数文本列的分类编码（加载时完成）对内存和计数的影响
+    text_df = result['json2'].frame
+    encoded, encode_time = _timed(DataProcessor._encode_categories, text_df.copy())
+    print(f"文本列内存: {text_df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB → "
+          f"分类编码后 {encoded.memory_usage(deep=True).sum() / 1024 ** 2:.1f} MB (编码 {encode_time:.2f}s)")
+    column = '病理诊断（病案首页）'
+    _, plain_time = _timed(lambda: text_df[column].value_counts())
+    _, coded_time = _timed(data_processor.value_counts, encoded[column])
+    print(f"诊断频率计数: {plain_time * 1000:.1f} ms → {coded_time * 1000:.1f} ms")
+
+
+def bench_prompt(args):
+    """对比全量数据提示词与检索打包提示词的大小和组装耗时"""
+    df = make_synthetic_frame(args.rows, numeric_cols=5, text_cols=3)
+    json2 = DataProcessor()._process_frame(df)['json2']
+    question = '肺腺癌患者的诊断情况如何？'
+    print(f"合成数据: {args.rows} 条记录")
+
+    legacy_prompt, legacy_time = _timed(
+        lambda: f"问题：{question}\n数据：{json.dumps(list(json2), ensure_ascii=False)}\n请分析并回答："
+    )
+    print(f"全量提示词: {len(legacy_prompt) / 1024:.1f} KB, 约 {estimate_tokens(legacy_prompt)} tokens, "
+          f"组装 {legacy_time * 1000:.1f} ms")
+
+    index, build_time = _timed(RetrievalIndex, json2)
+    print(f"检索索引构建（每个数据集一次）: {build_time * 1000:.1f} ms")
+    prompt, assemble_time = _timed(APIHandler._build_question_prompt, question, json2, index)
+    print(f"检索提示词: {len(prompt) / 1024:.1f} KB, 约 {estimate_tokens(prompt)} tokens, "
+          f"组装 {assemble_time * 1000:.1f} ms")
+
+
+def legacy_numeric_analysis(df):
+    """逐列计算分位数和异常值的原始实现，作为基准对照"""
+    basic_stats = df.describe().to_dict()
+    outliers = {}
+    for column in df.columns:
+        Q1 = df[column].quantile(0.25)
+        Q3 = df[column].quantile(0.75)
+        IQR = Q3 - Q1
+        lower_bound = Q1 - 1.5 * IQR
+        upper_bound = Q3 + 1.5 * IQR
+        outliers[column] = {
+            'count': len(df[(df[column] < lower_bound) | (df[column] > upper_bound)]),
+            'percentage': len(df[(df[column] < lower_bound) | (df[column] > upper_bound)]) / len(df) * 100
+        }
+    correlation = df.corr().to_dict()
+    return {'basic_stats': basic_stats, 'outliers': outliers, 'correlation': correlation}
+
+
+def bench_numeric(args):
+    """对比逐列统计与向量化统计在宽表上的耗时，并校验结果一致"""
+    df = make_synthetic_frame(args.rows, numeric_cols=args.cols, text_cols=0)
+    df = df.drop(columns=['病理诊断（病案首页）'])
+    print(f"合成数据: {args.rows} 行 × {args.cols} 个检验指标列")
+
+    legacy, legacy_time = _timed(legacy_numeric_analysis, df)
+    print(f"逐列统计: {legacy_time:.2f}s")
+    result, vectorized_time = _timed(DataAnalyzer().analyze_numeric_data, df)
+    print(f"向量化统计: {vectorized_time:.2f}s (加速 {legacy_time / max(vectorized_time, 1e-9):.1f}x)")
+
+    stats_diff = np.nanmax(np.abs(pd.DataFrame(result['basic_stats']).values
+                                  - pd.DataFrame(legacy['basic_stats']).values))
+    corr_diff = np.nanmax(np.abs(pd.DataFrame(result['correlation']).values
+                                 - pd.DataFrame(legacy['correlation']).values))
+    outliers_match = all(result['outliers'][c]['count'] == legacy['outliers'][c]['count'] for c in df.columns)
+    print(f"最大偏差: 描述统计 {stats_diff:.2e}, 相关系数 {corr_diff:.2e}, 异常值计数一致: {outliers_match}")
+
+
+def bench_incremental(args):
+    """对比增量合并与全量重新计算的耗时和结果偏差"""
+    df = make_synthetic_frame(args.rows + args.delta_rows, numeric_cols=args.cols, text_cols=3)
+    processor = DataProcessor()
+    base = processor._process_frame(df.iloc[:args.rows])
+    delta = processor._process_frame(df.iloc[args.rows:])
+    full = processor._process_frame(df)
+    print(f"已有数据 {args.rows} 行 + 增量 {args.delta_rows} 行, {args.cols} 个检验指标列")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        state_path = os.path.join(tmp_dir, 'state.pkl')
+        analyzer = DataAnalyzer()
+        analyzer.analyze_data_incremental(base['json1'], base['json2'], state_path)
+        merged, merge_time = _timed(analyzer.analyze_data_incremental, delta['json1'], delta['json2'], state_path)
+    recomputed, full_time = _timed(DataAnalyzer().analyze_data, full['json1'], full['json2'])
+    print(f"增量合并: {merge_time:.3f}s, 全量重新计算: {full_time:.3f}s")
+
+    merged_stats = pd.DataFrame(merged['numeric_analysis']['basic_stats'])
+    full_stats = pd.DataFrame(recomputed['numeric_analysis']['basic_stats'])
+    exact_diff = (merged_stats - full_stats).loc[['count', 'mean', 'std', 'min', 'max']].abs().max().max()
+    values = full['json1'].frame
+    rank_error = max(
+        abs((values[column].dropna() <= merged_stats[column][name]).mean() - q)
+        for column in values.columns for name, q in [('25%', 0.25), ('50%', 0.5), ('75%', 0.75)]
+    )
+    outlier_error = max(
+        abs(merged['numeric_analysis']['outliers'][c]['count'] - recomputed['numeric_analysis']['outliers'][c]['count'])
+        for c in values.columns
+    ) / len(values)
+    corr_diff = np.nanmax(np.abs(pd.DataFrame(merged['numeric_analysis']['correlation']).values
+                                 - pd.DataFrame(recomputed['numeric_analysis']['correlation']).values))
+    print(f"计数/均值/标准差/极值最大偏差: {exact_diff:.2e}, 相关系数最大偏差: {corr_diff:.2e}")
+    print(f"分位数最大秩误差: {rank_error:.4%}, 异常值数量最大误差: {outlier_error:.4%} (占总行数)")
+    print(f"诊断频率一致: {merged['diagnosis_analysis'] == recomputed['diagnosis_analysis']}")
+
+
+def bench_diagnosis(args):
+    """对比逐行拆分诊断与诊断词项索引的词频统计耗时"""
+    rng = np.random.default_rng(0)
+    # 多个诊断以中文标点连接，部分带ICD编码
+    codes = np.array(['', '(C34.1)', '(C50.900x001)', '(K29.5)'])
+    parts = [rng.choice(DIAGNOSES, args.rows), rng.choice(codes, args.rows),
+             rng.choice(['', '，淋巴结转移', '、高血压', '；糖尿病'], args.rows)]
+    diagnosis = pd.Series(np.char.add(np.char.add(parts[0], parts[1]), parts[2])).astype('category')
+    print(f"合成诊断: {args.rows} 行, {len(diagnosis.cat.categories)} 种不同取值")
+
+    legacy, legacy_time = _timed(lambda: diagnosis.astype(str).str.split(',').explode().str.strip().value_counts())
+    print(f"逐行按英文逗号拆分: {legacy_time:.2f}s, {len(legacy)} 个词项")
+    index, index_time = _timed(DiagnosisTermIndex, diagnosis)
+    print(f"诊断词项索引: {index_time:.3f}s, {len(index.terms)} 个词项, 前5: {index.top_terms(5)}")
+    rows, search_time = _timed(index.search, '腺癌')
+    print(f"检索“腺癌”: {len(rows)} 行, {search_time * 1000:.1f} ms")
+
+
+# 各医院实际提供的文件格式：(文件名, 写出函数)
+SOURCE_FORMATS = [
+    ('gbk.csv', lambda df, path: df.to_csv(path, index=False, encoding='gbk')),
+    ('gb18030.csv', lambda df, path: df.to_csv(path, index=False, encoding='gb18030')),
+    ('utf8.csv', lambda df, path: df.to_csv(path, index=False, encoding='utf-8')),
+    ('utf8_bom.csv', lambda df, path: df.to_csv(path, index=False, encoding='utf-8-sig')),
+    ('records.jsonl', lambda df, path: df.to_json(path, orient='records', lines=True, force_ascii=False)),
+    ('records.json', lambda df, path: df.to_json(path, orient='records', force_ascii=False)),
+]
+
+
+def bench_formats(args):
+    """对比固定GBK解析与格式/编码自动识别后的读取耗时"""
+    df = make_synthetic_frame(args.rows, args.numeric_cols, args.text_cols)
+    # 关闭列式缓存，只测量解析本身
+    data_processor.PROCESSED_CACHE_DIR = ''
+    print(f"合成数据: {args.rows} 行 × {df.shape[1]} 列")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, write in SOURCE_FORMATS:
+            path = os.path.join(tmp_dir, name)
+            write(df, path)
+            size_mb = os.path.getsize(path) / 1024 / 1024
+            try:
+                _, legacy_time = _timed(lambda: pd.read_csv(path, encoding='gbk'))
+                legacy = f"{legacy_time:.2f}s"
+            except Exception:
+                legacy = '无法读取'
+            processor = DataProcessor()
+            (file_format, encoding), sniff_time = _timed(processor.sniff_source, path)
+            loaded, load_time = _timed(processor.load_and_clean_data, path)
+            print(f"{name:<14} {size_mb:7.1f} MB  识别为 {file_format}/{encoding} ({sniff_time * 1000:.1f} ms)  "
+                  f"固定GBK解析: {legacy:<8} 自动识别读取: {load_time:.2f}s  {loaded.shape}")
+
+
+# 病历导出表中的检验项目：(名称, 均值, 标准差)，超出部分以“检验指标N”补齐
+EMR_LAB_ITEMS = [
+    ('白细胞计数', 6.5, 2.0), ('红细胞计数', 4.6, 0.5), ('血红蛋白', 135, 15), ('血小板计数', 230, 60),
+    ('中性粒细胞百分比', 60, 10), ('淋巴细胞百分比', 30, 8), ('谷丙转氨酶', 25, 12), ('谷草转氨酶', 24, 10),
+    ('总胆红素', 12, 5), ('白蛋白', 42, 4), ('肌酐', 75, 18), ('尿素氮', 5.2, 1.5),
+    ('葡萄糖', 5.4, 1.2), ('总胆固醇', 4.8, 0.9), ('甘油三酯', 1.5, 0.7), ('C反应蛋白', 8, 10),
+    ('癌胚抗原', 3.5, 4.0), ('甲胎蛋白', 6, 8), ('CA125', 20, 25), ('CA199', 18, 20),
+]
+EMR_DATE_COLUMNS = ['入院日期', '出院日期', '报告日期']
+EMR_DEPARTMENTS = ['胸外科', '乳腺外科', '胃肠外科', '肝胆外科', '肿瘤内科', '呼吸内科', '消化内科', '甲状腺外科']
+EMR_ICD_CODES = ['', '(C34.1)', '(C50.900x001)', '(C16.9)', '(C18.7)', '(C22.0)', '(K29.5)', '(C73.x00)']
+
+
+def make_emr_frame(rows, lab_cols=20, visits_per_patient=5, nan_ratio=0.1, seed=0):
+    """生成与真实病历导出表字段一致的合成数据：标识列、病理诊断、检验指标和日期列"""
+    rng = np.random.default_rng(seed)
+    patients = max(rows // visits_per_patient, 1)
+    patient = rng.integers(0, patients, rows)
+    data = {
+        '病案号': np.char.add('BA', np.char.zfill(patient.astype(str), 8)),
+        '门诊号': np.char.add('MZ', np.char.zfill((patient * 7 + 13).astype(str), 9)),
+        '住院号': np.char.add('ZY', np.char.zfill((patient * 3 + 5).astype(str), 9)),
+        '就诊标识（医渡云计算）': np.char.add('YD', np.char.zfill(rng.permutation(rows).astype(str), 10)),
+        '报告单号': np.char.add('BG', np.char.zfill(np.arange(rows).astype(str), 10)),
+        '性别': np.where(patient % 2 == 0, '男', '女'),
+        '科室': np.asarray(EMR_DEPARTMENTS)[patient % len(EMR_DEPARTMENTS)],
+    }
+    # 同一患者的诊断固定，部分诊断附带ICD编码和合并诊断
+    diagnosis = np.char.add(np.asarray(DIAGNOSES)[patient % len(DIAGNOSES)],
+                            np.asarray(EMR_ICD_CODES)[(patient // len(DIAGNOSES)) % len(EMR_ICD_CODES)])
+    comorbidity = rng.choice(['', '，淋巴结转移', '、高血压', '；2型糖尿病'], rows, p=[0.7, 0.1, 0.1, 0.1])
+    data['病理诊断（病案首页）'] = np.char.add(diagnosis, comorbidity)
+
+    # 每位患者一个基准入院日期，各次就诊在其后若干天
+    first_visit = np.datetime64('2018-01-01') + rng.integers(0, 6 * 365, patients).astype('timedelta64[D]')
+    admission = first_visit[patient] + rng.integers(0, 365, rows).astype('timedelta64[D]')
+    dates = {
+        '入院日期': admission,
+        '出院日期': admission + rng.integers(1, 30, rows).astype('timedelta64[D]'),
+        '报告日期': admission + rng.integers(0, 10, rows).astype('timedelta64[D]'),
+    }
+    for column in EMR_DATE_COLUMNS:
+        values = np.datetime_as_string(dates[column]).astype(object)
+        values[rng.random(rows) < nan_ratio] = None
+        data[column] = values
+
+    for i in range(lab_cols):
+        name, mean, std = EMR_LAB_ITEMS[i] if i < len(EMR_LAB_ITEMS) else (f'检验指标{i + 1}', 100, 15)
+        values = np.round(np.abs(rng.normal(mean, std, rows)), 2)
+        values[rng.random(rows) < nan_ratio] = np.nan
+        data[name] = values
+    return pd.DataFrame(data)
+
+
+def write_emr_csv(path, rows, lab_cols=20, seed=0):
+    """按医院导出习惯写出GBK编码的合成病历CSV"""
+    make_emr_frame(rows, lab_cols, seed=seed).to_csv(path, index=False, encoding='gbk')
+    return path
+
+
+def bench_generate(args):
+    """生成合成病历CSV，便于在应用中手动复现"""
+    write_emr_csv(args.output, args.rows, args.lab_cols, args.seed)
+    print(f"已生成 {args.output}: {args.rows} 行, {args.lab_cols} 个检验指标, "
+          f"{os.path.getsize(args.output) / 1024 / 1024:.1f} MB")
+
+
+def bench_temporal(args):
+    """对比逐列自动推断日期并用pandas重采样与时间索引聚合的耗时"""
+    df = make_emr_frame(args.rows, args.lab_cols)
+    result = DataProcessor()._process_frame(DataProcessor._encode_categories(df.drop(columns=DataProcessor.COLUMNS_TO_DROP)))
+    numeric_df = result['json1'].frame
+    print(f"合成病历: {args.rows} 行, {args.lab_cols} 个检验指标, 日期列 {EMR_DATE_COLUMNS}")
+
+    def legacy():
+        for column in EMR_DATE_COLUMNS:
+            dates = pd.to_datetime(result['json2'].frame[column].astype(object))
+            resampled = numeric_df.set_index(dates)
+            for freq in ('D', 'W-MON', 'MS'):
+                resampled.resample(freq).mean().rolling(3, min_periods=1).mean()
+    _, legacy_time = _timed(legacy)
+    print(f"逐元素推断日期 + pandas重采样: {legacy_time:.2f}s")
+
+    def engine():
+        indexes = build_time_indexes(result['json1'], result['json2'])
+        for index in indexes.values():
+            for freq in ('D', 'W', 'M'):
+                index.aggregate(freq).rolling_means()
+        return indexes
+    indexes, engine_time = _timed(engine)
+    print(f"时间索引（格式推断 + 按日聚合 + 周/月推导）: {engine_time:.2f}s "
+          f"(加速 {legacy_time / max(engine_time, 1e-9):.1f}x), 识别格式: "
+          f"{ {column: index.format for column, index in indexes.items()} }")
+
+
+SUITE_QUESTION = '肺腺癌患者的白细胞计数有什么特点？'
+
+
+def _suite_stages(csv_path):
+    """一次完整流程的各阶段：(阶段名, 执行函数)，阶段间通过state传递结果"""
+    state = {}
+
+    def ingest():
+        state['result'] = DataProcessor().process_data(csv_path)
+
+    def ingest_cached():
+        # 第二次读取同一文件时命中列式缓存
+        DataProcessor().process_data(csv_path)
+
+    def analyze():
+        result = state['result']
+        state['analysis'] = DataAnalyzer().analyze_data(result['json1'], result['json2'])
+
+    def visualize():
+        result = state['result']
+        figures = DataVisualizer().create_all_visualizations(result['json1'], result['json2'])
+        for group in figures.values():
+            for name in group:
+                try:
+                    group[name]
+                except Exception:
+                    # 缺少字体等环境问题导致的单个图表失败不影响其他图表计时
+                    pass
+
+    def retrieval_index():
+        state['index'] = RetrievalIndex(state['result']['json2'])
+
+    def llm_stream():
+        ''.join(APIHandler.stream_data_question(
+            SUITE_QUESTION, state['result']['json2'], state['index'], state['analysis']))
+
+    def llm_answer():
+        APIHandler.analyze_data_question(SUITE_QUESTION, state['result']['json2'], state['index'], state['analysis'])
+
+    return [('ingest', ingest), ('ingest_cached', ingest_cached), ('analyze', analyze), ('visualize', visualize),
+            ('retrieval_index', retrieval_index), ('llm_stream', llm_stream), ('llm_answer', llm_answer)]
+
+
+def _span_paths(records):
+    """以“父区间/子区间”路径标识每个区间，图表构建区间附带图表名"""
+    by_id = {record['span_id']: record for record in records}
+
+    def label(record):
+        return f"{record['name']}.{record['figure']}" if 'figure' in record else record['name']
+
+    paths = {}
+    for record in records:
+        parts = [label(record)]
+        parent = by_id.get(record['parent_id'])
+        while parent is not None:
+            parts.append(label(parent))
+            parent = by_id.get(parent['parent_id'])
+        paths[record['span_id']] = '/'.join(reversed(parts))
+    return paths
+
+
+def _summarize_runs(runs):
+    """汇总多次运行：耗时取中位数，同一路径在一次运行中出现多次时先求和；按开始时间排序，父区间在前"""
+    per_run = []
+    for records in runs:
+        records = sorted(records, key=lambda record: record['started_at'])
+        paths = _span_paths(records)
+        totals = {}
+        for record in records:
+            entry = totals.setdefault(paths[record['span_id']], {'wall_seconds': 0.0, 'cpu_seconds': 0.0})
+            entry['wall_seconds'] += record['wall_seconds']
+            entry['cpu_seconds'] += record['cpu_seconds']
+            for metric in ('time_to_first_token', 'tokens_per_second'):
+                if metric in record:
+                    entry[metric] = record[metric]
+        per_run.append(totals)
+
+    summary = {}
+    for path in per_run[0]:
+        values = [totals[path] for totals in per_run if path in totals]
+        summary[path] = {metric: float(np.median([value[metric] for value in values if metric in value]))
+                         for metric in values[0]}
+    return summary
+
+
+def _measure_memory(stages):
+    """单独执行一遍流程，用tracemalloc记录每个阶段的Python/NumPy内存分配峰值（MB）"""
+    peaks = {}
+    tracemalloc.start()
+    try:
+        for name, stage in stages:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+            stage()
+            peaks[name] = (tracemalloc.get_traced_memory()[1] - baseline) / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+    return peaks
+
+
+def run_suite(rows, lab_cols=20, repeat=3, llm_latency=0.05, llm_chunk_delay=0.002, seed=0):
+    """生成合成病历并多次执行完整流程，返回可写入基线文件的结果"""
+    profiler = profiling.get_profiler()
+    profiler.enabled = True
+    # 模型响应缓存会让后续运行直接命中，基准中关闭
+    llm_cache.LLM_CACHE_PATH = ''
+    reply = '该组患者白细胞计数整体处于正常范围，少数病例偏高，提示可能合并感染。' * 10
+
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            MockCompletionServer(reply=reply, latency=llm_latency, chunk_delay=llm_chunk_delay) as server:
+        api_handler.DEEPSEEK_API_URL = server.url
+        csv_path = write_emr_csv(os.path.join(tmp_dir, 'emr.csv'), rows, lab_cols, seed)
+
+        runs = []
+        for i in range(repeat):
+            # 每次运行使用新的列式缓存目录，保证首次读取为冷启动
+            data_processor.PROCESSED_CACHE_DIR = os.path.join(tmp_dir, f'cache{i}')
+            profiler.spans.clear()
+            for name, stage in _suite_stages(csv_path):
+                with profiling.span(name):
+                    stage()
+            runs.append(list(profiler.spans))
+
+        profiler.enabled = False
+        data_processor.PROCESSED_CACHE_DIR = os.path.join(tmp_dir, 'cache_memory')
+        memory = _measure_memory(_suite_stages(csv_path))
+        file_mb = os.path.getsize(csv_path) / 1024 / 1024
+
+    stages = _summarize_runs(runs)
+    for name, peak in memory.items():
+        stages[name]['peak_alloc_mb'] = peak
+    return {
+        'meta': {
+            'rows': rows,
+            'lab_cols': lab_cols,
+            'repeat': repeat,
+            'seed': seed,
+            'file_mb': round(file_mb, 2),
+            'llm_latency': llm_latency,
+            'llm_chunk_delay': llm_chunk_delay,
+            'max_rss_mb': round(profiling._peak_rss_bytes() / 1024 / 1024, 1) if profiling.resource else None,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'pyarrow': getattr(data_processor.pa, '__version__', None),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'created_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+        },
+        'stages': stages
+    }
+
+
+# 比较基线时各指标的方向：True表示数值越大越好
+SUITE_METRICS = {
+    'wall_seconds': False,
+    'cpu_seconds': False,
+    'peak_alloc_mb': False,
+    'time_to_first_token': False,
+    'tokens_per_second': True,
+}
+# 低于该绝对差值的变化视为测量噪声（秒 / MB / token每秒）
+SUITE_NOISE_FLOOR = {'wall_seconds': 0.02, 'cpu_seconds': 0.02, 'peak_alloc_mb': 5.0,
+                     'time_to_first_token': 0.02, 'tokens_per_second': 5.0}
+
+
+def compare_results(baseline, current, threshold):
+    """逐阶段逐指标对比，返回劣化超过阈值的（阶段, 指标, 基线值, 当前值）列表"""
+    regressions = []
+    for path, metrics in current['stages'].items():
+        previous = baseline['stages'].get(path)
+        if previous is None:
+            continue
+        for metric, higher_is_better in SUITE_METRICS.items():
+            if metric not in metrics or metric not in previous:
+                continue
+            old, new = previous[metric], metrics[metric]
+            change = (old - new) if higher_is_better else (new - old)
+            if change > SUITE_NOISE_FLOOR[metric] and change > threshold * abs(old):
+                regressions.append((path, metric, old, new))
+    return regressions
+
+
+def _print_suite(result, baseline=None):
+    """按阶段打印耗时、内存与模型调用指标，有基线时附带变化比例"""
+    def fmt(path, metric, value):
+        text = f"{value:.3f}" if metric != 'peak_alloc_mb' else f"{value:.1f}"
+        previous = (baseline or {}).get('stages', {}).get(path, {}).get(metric)
+        if previous:
+            text += f" ({(value - previous) / previous:+.0%})"
+        return text
+
+    meta = result['meta']
+    print(f"合成病历: {meta['rows']} 行, {meta['lab_cols']} 个检验指标, {meta['file_mb']} MB (GBK), "
+          f"重复 {meta['repeat']} 次取中位数, 进程峰值内存 {meta['max_rss_mb']} MB")
+    for path, metrics in result['stages'].items():
+        depth = path.count('/')
+        name = path.rsplit('/', 1)[-1]
+        details = '  '.join(f"{metric}={fmt(path, metric, value)}" for metric, value in metrics.items())
+        print(f"{'  ' * depth}{name:<{40 - 2 * depth}} {details}")
+
+
+def bench_suite(args):
+    """执行完整流程基准；可保存为基线，或与已有基线对比（劣化超过阈值时以非零状态退出）"""
+    # 指定的基线文件不存在时直接失败，避免对比被静默跳过
+    if args.baseline and not os.path.exists(args.baseline):
+        print(f"错误: 基线文件 {args.baseline} 不存在", file=sys.stderr)
+        return 2
+
+    result = run_suite(args.rows, args.lab_cols, args.repeat, args.llm_latency, args.llm_chunk_delay, args.seed)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        for key in ('rows', 'lab_cols', 'llm_latency', 'llm_chunk_delay'):
+            if baseline['meta'].get(key) != result['meta'][key]:
+                print(f"警告: 基线的 {key}={baseline['meta'].get(key)} 与本次 {result['meta'][key]} 不同，对比结果仅供参考")
+    _print_suite(result, baseline)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        print(f"基线已保存到 {args.save_baseline}")
+
+    if baseline is not None:
+        regressions = compare_results(baseline, result, args.threshold)
+        for path, metric, old, new in regressions:
+            print(f"性能劣化: {path} {metric} {old:.3f} → {new:.3f}")
+        if regressions:
+            return 1
+        print(f"与基线相比无超过 {args.threshold:.0%} 的劣化")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='医疗数据分析系统性能基准')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    process_parser = subparsers.add_parser('process', help='数据处理流程基准')
+    process_parser.add_argument('--rows', type=int, default=1_000_000)
+    process_parser.add_argument('--numeric-cols', type=int, default=20)
+    process_parser.add_argument('--text-cols', type=int, default=5)
+    process_parser.set_defaults(func=bench_process)
+
+    prompt_parser = subparsers.add_parser('prompt', help='问答提示词组装基准')
+    prompt_parser.add_argument('--rows', type=int, default=100_000)
+    prompt_parser.set_defaults(func=bench_prompt)
+
+    numeric_parser = subparsers.add_parser('numeric', help='数值统计基准（宽表）')
+    numeric_parser.add_argument('--rows', type=int, default=20_000)
+    numeric_parser.add_argument('--cols', type=int, default=500)
+    numeric_parser.set_defaults(func=bench_numeric)
+
+    incremental_parser = subparsers.add_parser('incremental', help='增量统计合并基准')
+    incremental_parser.add_argument('--rows', type=int, default=1_000_000)
+    incremental_parser.add_argument('--delta-rows', type=int, default=10_000)
+    incremental_parser.add_argument('--cols', type=int, default=20)
+    incremental_parser.set_defaults(func=bench_incremental)
+
+    diagnosis_parser = subparsers.add_parser('diagnosis', help='诊断词频统计基准')
+    diagnosis_parser.add_argument('--rows', type=int, default=1_000_000)
+    diagnosis_parser.set_defaults(func=bench_diagnosis)
+
+    formats_parser = subparsers.add_parser('formats', help='文件格式与编码识别读取基准')
+    formats_parser.add_argument('--rows', type=int, default=500_000)
+    formats_parser.add_argument('--numeric-cols', type=int, default=20)
+    formats_parser.add_argument('--text-cols', type=int, default=5)
+    formats_parser.set_defaults(func=bench_formats)
+
+    temporal_parser = subparsers.add_parser('temporal', help='日期解析与时间聚合基准')
+    temporal_parser.add_argument('--rows', type=int, default=1_000_000)
+    temporal_parser.add_argument('--lab-cols', type=int, default=20)
+    temporal_parser.set_defaults(func=bench_temporal)
+
+    generate_parser = subparsers.add_parser('generate', help='生成合成病历CSV（GBK编码）')
+    generate_parser.add_argument('output')
+    generate_parser.add_argument('--rows', type=int, default=100_000)
+    generate_parser.add_argument('--lab-cols', type=int, default=20)
+    generate_parser.add_argument('--seed', type=int, default=0)
+    generate_parser.set_defaults(func=bench_generate)
+
+    suite_parser = subparsers.add_parser('suite', help='完整流程基准（读取→分析→可视化→问答），可保存和对比基线')
+    suite_parser.add_argument('--rows', type=int, default=200_000)
+    suite_parser.add_argument('--lab-cols', type=int, default=20)
+    suite_parser.add_argument('--repeat', type=int, default=3)
+    suite_parser.add_argument('--seed', type=int, default=0)
+    suite_parser.add_argument('--llm-latency', type=float, default=0.05, help='模拟接口的响应延迟（秒）')
+    suite_parser.add_argument('--llm-chunk-delay', type=float, default=0.002, help='模拟接口流式片段间隔（秒）')
+    suite_parser.add_argument('--baseline', help='对比的基线文件（JSON）')
+    suite_parser.add_argument('--save-baseline', help='将本次结果保存为基线文件')
+    suite_parser.add_argument('--threshold', type=float, default=0.2, help='判定为劣化的相对变化比例')
+    suite_parser.set_defaults(func=bench_suite)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,7 +6,15 @@ load_dotenv()
 
 # API配置
 DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', 'sk-a34cfada22a747a29a54979e4c333e10')  # 替换为你的API密钥
-DEEPSEEK_API_URL = "https://api.deepseek.com/chat/completions"
+DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', "https://api.deepseek.com/chat/completions")
+
+# HTTP连接池配置
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', '10'))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '5'))  # 秒
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '120'))  # 秒，流式输出时为两次数据之间的最大间隔
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_BASE = float(os.getenv('HTTP_BACKOFF_BASE', '0.5'))  # 秒
+HTTP_BACKOFF_MAX = float(os.getenv('HTTP_BACKOFF_MAX', '10'))  # 秒
 
 # 文件上传配置
 UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads')
@@ -16,6 +24,108 @@ MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
 # 确保上传目录存在
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# 流式数据处理配置
+# 分块读取CSV时单块允许占用的内存上限（MB），决定每块的行数
+STREAM_MEMORY_LIMIT_MB = int(os.getenv('STREAM_MEMORY_LIMIT_MB', '256'))
+
+# 数据读取配置
+# 识别文件编码时采样的字节数（从第一个非ASCII字节开始计算）
+ENCODING_SAMPLE_BYTES = int(os.getenv('ENCODING_SAMPLE_BYTES', str(64 * 1024)))
+# CSV解析引擎：pyarrow（多线程解析，需安装pyarrow）或 c（pandas默认解析器）
+CSV_ENGINE = os.getenv('CSV_ENGINE', 'pyarrow')
+# 流式读取JSON Lines文件时每块的行数
+JSON_CHUNK_ROWS = int(os.getenv('JSON_CHUNK_ROWS', '100000'))
+# 文本列不同取值数不超过非空行数的该比例时转换为分类类型（字典编码），0表示不转换
+CATEGORICAL_MAX_UNIQUE_RATIO = float(os.getenv('CATEGORICAL_MAX_UNIQUE_RATIO', '0.5'))
+
+# 清理后数据的列式缓存目录（Arrow IPC），设置为空字符串时禁用
+PROCESSED_CACHE_DIR = os.getenv('PROCESSED_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'processed'))
+
+# 患者标识假名化配置
+# 由病案号等标识生成患者标识时使用的HMAC密钥（请勿泄露）；未设置时不生成患者标识，也不建立患者分组索引
+PATIENT_KEY_SALT = os.getenv('PATIENT_KEY_SALT', '')
+
+# 结果缓存配置
+# 内存层字节预算（MB），超出后按LRU淘汰
+RESULT_CACHE_MAX_MB = int(os.getenv('RESULT_CACHE_MAX_MB', '1024'))
+# 可选的磁盘缓存目录，未设置时仅使用内存缓存
+RESULT_CACHE_DIR = os.getenv('RESULT_CACHE_DIR') or None
+# 会话对数据集的租约有效期（秒）：租约期间数据集不会被淘汰，会话超过该时间无操作后自动释放
+DATASET_LEASE_TTL_SECONDS = int(os.getenv('DATASET_LEASE_TTL_SECONDS', '1800'))
+
+# 后台任务配置
+# 任务表（SQLite）路径
+JOB_DB_PATH = os.getenv('JOB_DB_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'jobs.sqlite3'))
+# 上传文件与任务结果的保存目录
+JOB_DATA_DIR = os.getenv('JOB_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'jobs'))
+# 后台处理上传文件的工作进程数
+JOB_MAX_WORKERS = int(os.getenv('JOB_MAX_WORKERS', '2'))
+# 页面轮询任务进度的间隔（秒）
+JOB_POLL_SECONDS = float(os.getenv('JOB_POLL_SECONDS', '1'))
+# 已结束任务及其结果文件的保留时长（秒），刷新页面后在此期间可直接恢复结果
+JOB_RETENTION_SECONDS = int(os.getenv('JOB_RETENTION_SECONDS', str(24 * 3600)))
+
+# 问答检索配置
+# 每个问题检索的最相关记录数
+RETRIEVAL_TOP_K = int(os.getenv('RETRIEVAL_TOP_K', '50'))
+# 问答提示词中数据部分的token预算
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '6000'))
+
+# 批量报告生成配置
+# 并发处理的患者数（建议不超过HTTP_POOL_SIZE，以便复用连接）
+BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '8'))
+# 每分钟发送给模型的token上限，0表示不限速
+BATCH_TOKENS_PER_MINUTE = int(os.getenv('BATCH_TOKENS_PER_MINUTE', '0'))
+# 限速时为每次调用的输出预留的token数
+BATCH_MAX_OUTPUT_TOKENS = int(os.getenv('BATCH_MAX_OUTPUT_TOKENS', '2000'))
+
+# 模型响应缓存配置
+# SQLite缓存文件路径，设置为空字符串时禁用缓存
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'llm_responses.sqlite3'))
+LLM_CACHE_TTL_SECONDS = int(os.getenv('LLM_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+LLM_CACHE_MAX_MB = int(os.getenv('LLM_CACHE_MAX_MB', '256'))
+
+# 数据分析并发配置
+# 并发执行各项分析的工作线程/进程数，1表示串行执行
+ANALYSIS_MAX_WORKERS = int(os.getenv('ANALYSIS_MAX_WORKERS', '4'))
+# 是否使用进程池（默认使用线程池，共享内存中的DataFrame无需复制）
+ANALYSIS_USE_PROCESSES = os.getenv('ANALYSIS_USE_PROCESSES', 'false').lower() == 'true'
+
+# 图表数据量配置
+# 每个图表传输到浏览器的数据点上限（直方图箱数、异常点数、时间序列点数按此分配）
+PLOT_POINTS_BUDGET = int(os.getenv('PLOT_POINTS_BUDGET', '5000'))
+# 每个变量的直方图最大分箱数
+PLOT_MAX_BINS = int(os.getenv('PLOT_MAX_BINS', '100'))
+
+# 图表导出并发数
+EXPORT_MAX_WORKERS = int(os.getenv('EXPORT_MAX_WORKERS', '4'))
+
+# 诊断词项索引配置
+# 并行分词的工作进程数，1表示串行
+DIAGNOSIS_INDEX_WORKERS = int(os.getenv('DIAGNOSIS_INDEX_WORKERS', '4'))
+# 不同诊断取值数达到该值时才启用多进程分词（进程启动有固定开销）
+DIAGNOSIS_INDEX_PARALLEL_MIN = int(os.getenv('DIAGNOSIS_INDEX_PARALLEL_MIN', '50000'))
+
+# 时间维度分析配置
+# 推断日期格式时每列采样的取值数
+TEMPORAL_SAMPLE_SIZE = int(os.getenv('TEMPORAL_SAMPLE_SIZE', '1000'))
+# 样本中按同一格式解析成功的比例达到该值时认定为日期列
+TEMPORAL_MIN_PARSE_RATIO = float(os.getenv('TEMPORAL_MIN_PARSE_RATIO', '0.9'))
+# 趋势图滚动均值的窗口（按所选粒度的周期数）
+TEMPORAL_ROLLING_WINDOW = int(os.getenv('TEMPORAL_ROLLING_WINDOW', '3'))
+
+# 增量分析配置
+# KLL分位数草图的容量参数，越大越精确（秩误差约 ±1.7/k，默认1000时约 ±0.2%）
+INCREMENTAL_SKETCH_K = int(os.getenv('INCREMENTAL_SKETCH_K', '1000'))
+
+# 性能剖析配置
+# 是否记录各阶段耗时、CPU时间、内存增量及大模型首字延迟（关闭时几乎无开销）
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'false').lower() == 'true'
+# 可选的JSON Lines文件路径，每个完成的区间追加一行
+PROFILING_EXPORT_PATH = os.getenv('PROFILING_EXPORT_PATH') or None
+# 内存中保留的最近区间数
+PROFILING_MAX_SPANS = int(os.getenv('PROFILING_MAX_SPANS', '2000'))
+
 # 其他配置参数（可选）
 # 例如，设置最大token数、温度等
 MAX_TOKENS = 150
@@ -1,36 +1,63 @@
 import pandas as pd
 import numpy as np
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from scipy import stats
+from data_processor import RecordView, to_frame, is_text_column, value_counts
+from incremental_stats import IncrementalAnalyzer
+from diagnosis_terms import get_term_index
+from temporal import get_time_indexes, summarize_trend
+from profiling import span
+from config import ANALYSIS_MAX_WORKERS, ANALYSIS_USE_PROCESSES
 import warnings
 warnings.filterwarnings('ignore')
 
+# 数值统计按行分块累加时每块的行数
+SUMMARY_BLOCK_ROWS = 65536
+
+
+def _timed_call(name, parent, func, *args):
+    """执行分析函数并返回（结果，耗时秒数）；parent为发起分析的剖析区间（工作线程中需显式关联）"""
+    with span(f'analyze_data.{name}', parent=parent):
+        start = time.perf_counter()
+        result = func(*args)
+        return result, time.perf_counter() - start
+
+
 class DataAnalyzer:
     def __init__(self):
         self.analysis_results = {}
+        self.stage_timings = {}
     
     def analyze_numeric_data(self, json1):
         """分析数值型数据"""
         try:
-            df = pd.DataFrame(json1)
-            
-            # 基本统计描述
-            basic_stats = df.describe().to_dict()
-            
-            # 异常值检测
-            outliers = {}
-            for column in df.columns:
-                Q1 = df[column].quantile(0.25)
-                Q3 = df[column].quantile(0.75)
-                IQR = Q3 - Q1
-                lower_bound = Q1 - 1.5 * IQR
-                upper_bound = Q3 + 1.5 * IQR
-                outliers[column] = {
-                    'count': len(df[(df[column] < lower_bound) | (df[column] > upper_bound)]),
-                    'percentage': len(df[(df[column] < lower_bound) | (df[column] > upper_bound)]) / len(df) * 100
+            df = to_frame(json1).select_dtypes(include=[np.number])
+            columns = list(df.columns)
+            
+            # 转换为一个float64数组（不再另做连续化副本），所有统计量在该数组上计算
+            values = df.to_numpy(dtype=np.float64, na_value=np.nan)
+            summary = self._numeric_summary(values)
+            
+            # 基本统计描述（与DataFrame.describe()结构一致）
+            stat_names = ['count', 'mean', 'std', 'min', '25%', '50%', '75%', 'max']
+            basic_stats = {
+                column: {name: float(summary[name][i]) for name in stat_names}
+                for i, column in enumerate(columns)
+            }
+            
+            # 异常值检测（IQR准则）
+            outliers = {
+                column: {
+                    'count': int(summary['outlier_count'][i]),
+                    'percentage': float(summary['outlier_count'][i] / len(values) * 100) if len(values) else 0.0
                 }
+                for i, column in enumerate(columns)
+            }
             
             # 相关性分析
-            correlation = df.corr().to_dict()
+            correlation = pd.DataFrame(summary['correlation'], index=columns, columns=columns).to_dict()
             
             return {
                 'basic_stats': basic_stats,
@@ -40,29 +67,117 @@ class DataAnalyzer:
         except Exception as e:
             raise Exception(f"数值型数据分析失败: {str(e)}")
     
+    @staticmethod
+    def _numeric_summary(values):
+        """在二维float数组上向量化计算描述统计、IQR异常值数量和成对相关系数（缺失值为NaN）
+
+        按行分块累加和与交叉乘积，分位数逐列排序求出，临时数组只与块或单列同样大小，不复制整个数组。
+        """
+        n_rows, n_cols = values.shape
+        blocks = [slice(start, start + SUMMARY_BLOCK_ROWS) for start in range(0, n_rows, SUMMARY_BLOCK_ROWS)]
+        
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # 第一遍：各列非空计数与均值
+            count = np.zeros(n_cols, dtype=np.int64)
+            total = np.zeros(n_cols)
+            for block in blocks:
+                chunk = values[block]
+                valid = ~np.isnan(chunk)
+                count += valid.sum(axis=0)
+                total += np.where(valid, chunk, 0.0).sum(axis=0)
+            mean = np.where(count > 0, total / count, np.nan)
+            
+            # 第二遍：成对完整观测的中心化和、平方和与交叉乘积，通过矩阵乘法一次求出所有列对
+            pair_count = np.zeros((n_cols, n_cols))
+            pair_sum = np.zeros((n_cols, n_cols))
+            pair_sum_sq = np.zeros((n_cols, n_cols))
+            cross = np.zeros((n_cols, n_cols))
+            for block in blocks:
+                chunk = values[block]
+                valid = ~np.isnan(chunk)
+                mask = valid.astype(np.float64)
+                centered = np.where(valid, chunk - mean, 0.0)
+                pair_count += mask.T @ mask
+                pair_sum += centered.T @ mask
+                cross += centered.T @ centered
+                # 原地平方，复用中心化数组
+                np.square(centered, out=centered)
+                pair_sum_sq += centered.T @ mask
+            
+            # 样本标准差（各列平方和即pair_sum_sq的对角线）
+            std = np.where(count > 1, np.sqrt(np.diag(pair_sum_sq) / np.maximum(count - 1, 1)), np.nan)
+            
+            # 成对完整观测的Pearson相关系数（与DataFrame.corr()一致）
+            covariance = cross - pair_sum * pair_sum.T / pair_count
+            variance = pair_sum_sq - pair_sum ** 2 / pair_count
+            correlation = covariance / np.sqrt(variance * variance.T)
+            correlation = np.clip(correlation, -1.0, 1.0)
+            correlation[(pair_count < 1) | (variance <= 0) | (variance.T <= 0)] = np.nan
+            diagonal = np.diag_indices(n_cols)
+            correlation[diagonal] = np.where(np.isnan(correlation[diagonal]), np.nan, 1.0)
+        
+        # 逐列排序非空值，按线性插值取分位数，同时得到最小/最大值和IQR异常值数量
+        quantiles = {name: np.full(n_cols, np.nan) for name in ('25%', '50%', '75%')}
+        col_min = np.full(n_cols, np.nan)
+        col_max = np.full(n_cols, np.nan)
+        outlier_count = np.zeros(n_cols, dtype=np.int64)
+        for j in range(n_cols):
+            column = values[:, j]
+            column = column[~np.isnan(column)]
+            if len(column) == 0:
+                continue
+            column.sort()
+            last = len(column) - 1
+            for q, name in [(0.25, '25%'), (0.5, '50%'), (0.75, '75%')]:
+                position = q * last
+                lower, upper = int(np.floor(position)), int(np.ceil(position))
+                quantiles[name][j] = column[lower] + (column[upper] - column[lower]) * (position - lower)
+            col_min[j], col_max[j] = column[0], column[last]
+            iqr = quantiles['75%'][j] - quantiles['25%'][j]
+            lower_bound = quantiles['25%'][j] - 1.5 * iqr
+            upper_bound = quantiles['75%'][j] + 1.5 * iqr
+            # 已排序，用二分查找统计两侧越界的数量
+            outlier_count[j] = (np.searchsorted(column, lower_bound, side='left')
+                                + len(column) - np.searchsorted(column, upper_bound, side='right'))
+        
+        return {
+            'count': count.astype(np.float64),
+            'mean': mean,
+            'std': std,
+            'min': col_min,
+            '25%': quantiles['25%'],
+            '50%': quantiles['50%'],
+            '75%': quantiles['75%'],
+            'max': col_max,
+            'outlier_count': outlier_count,
+            'correlation': correlation
+        }
+    
     def analyze_text_data(self, json2):
         """分析文本型数据"""
         try:
-            df = pd.DataFrame(json2)
+            df = to_frame(json2)
             
-            # 文本长度分析
+            text_columns = [column for column in df.columns if is_text_column(df[column])]
+            
+            # 文本长度分析（分类列只计算各取值的长度）
             text_lengths = {}
-            for column in df.columns:
-                if df[column].dtype == 'object':
-                    text_lengths[column] = {
-                        'mean_length': df[column].str.len().mean(),
-                        'max_length': df[column].str.len().max(),
-                        'min_length': df[column].str.len().min()
-                    }
-            
-            # 唯一值分析
+            for column in text_columns:
+                lengths = df[column].str.len()
+                text_lengths[column] = {
+                    'mean_length': lengths.mean(),
+                    'max_length': lengths.max(),
+                    'min_length': lengths.min()
+                }
+            
+            # 唯一值分析（分类列直接对编码计数）
             unique_values = {}
-            for column in df.columns:
-                if df[column].dtype == 'object':
-                    unique_values[column] = {
-                        'count': df[column].nunique(),
-                        'top_values': df[column].value_counts().head(5).to_dict()
-                    }
+            for column in text_columns:
+                counts = value_counts(df[column])
+                unique_values[column] = {
+                    'count': len(counts),
+                    'top_values': counts.head(5).to_dict()
+                }
             
             return {
                 'text_lengths': text_lengths,
@@ -74,18 +189,16 @@ class DataAnalyzer:
     def analyze_diagnosis_data(self, json2):
         """分析诊断数据"""
         try:
-            df = pd.DataFrame(json2)
+            df = to_frame(json2)
             
             # 诊断频率分析
             diagnosis_freq = {}
-            if '病理诊断（病案首页）' in df.columns:
-                diagnosis_freq = df['病理诊断（病案首页）'].value_counts().head(10).to_dict()
-            
-            # 诊断词云分析
             diagnosis_words = {}
             if '病理诊断（病案首页）' in df.columns:
-                words = df['病理诊断（病案首页）'].str.split(',').explode().str.strip()
-                diagnosis_words = words.value_counts().head(20).to_dict()
+                diagnosis_freq = value_counts(df['病理诊断（病案首页）']).head(10).to_dict()
+                
+                # 诊断词云分析：按中文标点和ICD编码切分的词项频率（与词云共用同一索引）
+                diagnosis_words = get_term_index(json2).top_terms(20)
             
             return {
                 'diagnosis_freq': diagnosis_freq,
@@ -94,38 +207,70 @@ class DataAnalyzer:
         except Exception as e:
             raise Exception(f"诊断数据分析失败: {str(e)}")
     
-    def analyze_temporal_data(self, json1):
-        """分析时间序列数据"""
+    def analyze_temporal_data(self, json1, json2):
+        """分析时间序列数据（日期列位于json2，检验指标位于json1）"""
         try:
-            df = pd.DataFrame(json1)
-            
-            # 时间趋势分析
-            temporal_trends = {}
-            for column in df.columns:
-                if 'date' in column.lower() or 'time' in column.lower():
-                    temporal_trends[column] = {
-                        'min_date': df[column].min(),
-                        'max_date': df[column].max(),
-                        'date_range': (df[column].max() - df[column].min()).days
-                    }
+            # 时间趋势分析：日期列解析一次后按日聚合，与趋势图共用同一时间索引
+            temporal_trends = {
+                column: summarize_trend(index.aggregate('D'))
+                for column, index in get_time_indexes(json1, json2).items()
+            }
             
             return temporal_trends
         except Exception as e:
             raise Exception(f"时间序列数据分析失败: {str(e)}")
     
-    def analyze_data(self, json1, json2):
-        """完整的数据分析流程"""
+    def analyze_data(self, json1, json2, max_workers=None):
+        """完整的数据分析流程：各项分析共享同一份只读DataFrame并发执行"""
         try:
-            self.analysis_results = {
-                'numeric_analysis': self.analyze_numeric_data(json1),
-                'text_analysis': self.analyze_text_data(json2),
-                'diagnosis_analysis': self.analyze_diagnosis_data(json2),
-                'temporal_analysis': self.analyze_temporal_data(json1)
+            # 每个数据集只构建一次DataFrame；记录视图直接传递，以便复用其上缓存的词项索引和时间索引
+            df1 = json1 if isinstance(json1, RecordView) else to_frame(json1)
+            df2 = json2 if isinstance(json2, RecordView) else to_frame(json2)
+            tasks = {
+                'numeric_analysis': (self.analyze_numeric_data, df1),
+                'text_analysis': (self.analyze_text_data, df2),
+                'diagnosis_analysis': (self.analyze_diagnosis_data, df2),
+                'temporal_analysis': (self.analyze_temporal_data, df1, df2)
             }
+            
+            workers = min(max_workers or ANALYSIS_MAX_WORKERS, len(tasks))
+            with span('analyze_data', rows=len(df1), columns=to_frame(df1).shape[1] + to_frame(df2).shape[1],
+                      workers=workers) as parent:
+                if workers <= 1:
+                    outputs = {name: _timed_call(name, parent, func, *args)
+                               for name, (func, *args) in tasks.items()}
+                else:
+                    # 线程池共享内存中的DataFrame；进程池适合CPU密集且GIL竞争明显的场景，但需要序列化数据
+                    # （子进程中的剖析区间记录在子进程内，只能通过导出文件查看）
+                    task_parent = None if ANALYSIS_USE_PROCESSES else parent
+                    if ANALYSIS_USE_PROCESSES:
+                        # 以spawn方式启动子进程，避免fork页面及线程池所在的多线程进程导致死锁
+                        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+                    else:
+                        executor = ThreadPoolExecutor(max_workers=workers)
+                    with executor:
+                        futures = {name: executor.submit(_timed_call, name, task_parent, func, *args)
+                                   for name, (func, *args) in tasks.items()}
+                        outputs = {name: future.result() for name, future in futures.items()}
+            
+            self.analysis_results = {name: result for name, (result, _) in outputs.items()}
+            # 记录各项分析的耗时（秒）
+            self.stage_timings = {name: elapsed for name, (_, elapsed) in outputs.items()}
             return self.analysis_results
         except Exception as e:
             raise Exception(f"数据分析失败: {str(e)}")
     
+    def analyze_data_incremental(self, json1, json2, state_path):
+        """增量分析：将新增数据合并进持久化的汇总状态，耗时与增量大小成正比"""
+        try:
+            state = IncrementalAnalyzer.load(state_path)
+            state.update(json1, json2)
+            state.save(state_path)
+            self.analysis_results = state.results()
+            return self.analysis_results
+        except Exception as e:
+            raise Exception(f"增量数据分析失败: {str(e)}")
+    
     def get_summary_statistics(self):
         """获取汇总统计信息"""
         try:
@@ -1,98 +1,523 @@
 import pandas as pd
+import numpy as np
+import codecs
+import hashlib
+import hmac
 import json
-import math
+import os
+import re
+from collections.abc import Sequence
+from profiling import profiled, current_span
+from config import (STREAM_MEMORY_LIMIT_MB, PROCESSED_CACHE_DIR, ENCODING_SAMPLE_BYTES,
+                    CSV_ENGINE, JSON_CHUNK_ROWS, CATEGORICAL_MAX_UNIQUE_RATIO, PATIENT_KEY_SALT)
+
+try:
+    import pyarrow as pa
+    import pyarrow.json as pa_json
+except ImportError:  # 未安装pyarrow时不使用列式缓存，CSV/JSON使用pandas解析
+    pa = None
+
+
+class RecordView(Sequence):
+    """DataFrame上的只读记录视图，按需生成去除空值后的字典记录"""
+    # 批量生成记录时每批的行数
+    BLOCK_ROWS = 10000
+
+    def __init__(self, frame):
+        self.frame = frame
+        # 基于该视图派生的结构（如诊断词项索引）
+        self._derived = {}
+
+    def __len__(self):
+        return len(self.frame)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return RecordView(self.frame.iloc[index])
+        if index < 0:
+            index += len(self.frame)
+        if not 0 <= index < len(self.frame):
+            raise IndexError('记录索引超出范围')
+        return self._build_records(self.frame.iloc[index:index + 1])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self.frame), self.BLOCK_ROWS):
+            yield from self._build_records(self.frame.iloc[start:start + self.BLOCK_ROWS])
+
+    def __repr__(self):
+        return f"RecordView(rows={len(self.frame)}, columns={list(self.frame.columns)})"
+
+    @staticmethod
+    def _build_records(block):
+        """将一批行转换为字典记录，跳过NaN/None值"""
+        columns = list(block.columns)
+        if not columns:
+            return [{} for _ in range(len(block))]
+        mask = block.notna().to_numpy().tolist()
+        # 按列取出Python原生值再按行拼装，避免逐行构造Series
+        rows = zip(*(block[column].tolist() for column in columns))
+        return [
+            {key: value for key, value, keep in zip(columns, row, row_mask) if keep}
+            for row, row_mask in zip(rows, mask)
+        ]
+
+    def to_list(self):
+        """生成全部记录"""
+        return list(self)
+    
+    def cached(self, key, build):
+        """按键缓存由底层DataFrame派生的结构，同一数据集只构建一次"""
+        if key not in self._derived:
+            self._derived[key] = build(self.frame)
+        return self._derived[key]
+
+
+# 字节序标记与对应编码（UTF-32需在UTF-16之前判断）
+BOM_ENCODINGS = [
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+# 无BOM时依次尝试的编码；GBK文件按其超集GB18030解码，兼容生僻字
+CANDIDATE_ENCODINGS = ['utf-8', 'gb18030']
+
+
+def detect_encoding(file_path, sample_bytes=None):
+    """根据BOM和采样字节识别文件编码（UTF-8/GBK/GB18030）"""
+    if sample_bytes is None:
+        sample_bytes = ENCODING_SAMPLE_BYTES
+    with open(file_path, 'rb') as f:
+        head = f.read(4)
+        for bom, encoding in BOM_ENCODINGS:
+            if head.startswith(bom):
+                return encoding
+        
+        # 跳过纯ASCII部分，从第一个非ASCII字节开始采样（该字节必然是字符起始位置）
+        f.seek(0)
+        while True:
+            block = f.read(sample_bytes)
+            if not block:
+                return 'utf-8'
+            match = re.search(rb'[\x80-\xff]', block)
+            if match:
+                break
+        sample = block[match.start():]
+        sample += f.read(sample_bytes - len(sample))
+        at_eof = not f.read(1)
+    
+    for encoding in CANDIDATE_ENCODINGS:
+        try:
+            # 增量解码允许采样末尾截断半个字符
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=at_eof)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    raise ValueError('无法识别文件编码（支持UTF-8、GBK、GB18030）')
+
+
+def detect_format(file_path, encoding):
+    """根据扩展名和首个非空白字符识别文件格式：csv、json（数组）或 jsonl（每行一个对象）"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in ('.jsonl', '.ndjson'):
+        return 'jsonl'
+    with open(file_path, encoding=encoding, errors='replace') as f:
+        head = f.read(ENCODING_SAMPLE_BYTES).lstrip()
+        if not head or head[0] not in '[{':
+            return 'csv'
+        if head[0] == '[':
+            return 'json'
+        # 首行即是完整对象则为JSON Lines，否则为跨行的单个JSON对象
+        first_line, newline, _ = head.partition('\n')
+        if not newline:
+            first_line += f.readline()
+    try:
+        json.loads(first_line)
+        return 'jsonl'
+    except json.JSONDecodeError:
+        return 'json'
+
+
+def is_text_column(series):
+    """判断是否为文本列（object、字符串或分类类型）"""
+    return (isinstance(series.dtype, pd.CategoricalDtype)
+            or pd.api.types.is_object_dtype(series.dtype)
+            or pd.api.types.is_string_dtype(series.dtype))
+
+
+def value_counts(series):
+    """按取值计数（降序，不含空值）；分类列直接对编码计数，无需逐个哈希字符串"""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        return series.value_counts()
+    codes = series.cat.codes.to_numpy()
+    counts = np.bincount(codes[codes >= 0], minlength=len(series.cat.categories))
+    present = np.flatnonzero(counts)
+    order = present[np.argsort(-counts[present], kind='stable')]
+    return pd.Series(counts[order], index=series.cat.categories[order], name='count')
+
+
+def to_frame(data):
+    """将记录列表或记录视图转换为DataFrame（记录视图直接返回底层DataFrame）"""
+    if isinstance(data, RecordView):
+        return data.frame
+    if isinstance(data, pd.DataFrame):
+        return data
+    return pd.DataFrame(data)
+
 
 class DataProcessor:
+    # 需要删除的标识列
+    COLUMNS_TO_DROP = ['病案号', '门诊号', '住院号', '就诊标识（医渡云计算）', '报告单号']
+    # 生成假名化患者标识的列（按优先级取第一个非空值）
+    PATIENT_ID_COLUMNS = ['病案号', '住院号', '门诊号']
+    # 假名化患者标识列名及长度（HMAC-SHA256摘要的前若干位十六进制字符）
+    PATIENT_KEY_COLUMN = '患者标识'
+    PATIENT_KEY_LENGTH = 20
+    # 估算分块行数时使用的采样行数
+    SAMPLE_ROWS = 1000
+    # 单块处理过程中同时存在的数据副本数（DataFrame + 各阶段记录列表）
+    CHUNK_COPY_FACTOR = 4
+    # 列式缓存格式版本，清理逻辑变化时递增以使旧缓存失效
+    CACHE_VERSION = 4
+
     def __init__(self):
         self.json1 = None
         self.json2 = None
+        # 源文件哈希缓存：(路径, 大小, 修改时间) -> 缓存文件路径
+        self._cache_paths = {}
+        # 源文件格式缓存：(路径, 大小, 修改时间) -> (格式, 编码)
+        self._source_formats = {}
     
-    def load_and_clean_data(self, file_path):
-        """加载并清理CSV数据"""
+    @profiled('load_and_clean_data', measure=lambda df: {'rows': len(df), 'columns': df.shape[1]})
+    def load_and_clean_data(self, file_path, columns=None):
+        """加载并清理CSV/JSON数据（优先读取列式缓存，可只读取指定的列）"""
         try:
-            # 读取CSV文件
-            df = pd.read_csv(file_path, encoding='gbk')
+            # 命中缓存时以内存映射方式读取，不再解析CSV
+            cache_path = self._cache_path(file_path)
+            if cache_path and os.path.exists(cache_path):
+                current_span().set(source='cache')
+                return self._read_cache(cache_path, columns)
+            
+            # 按识别出的格式和编码读取文件
+            df = self._read_source(file_path)
+            current_span().set(source='file', format=self.sniff_source(file_path)[0])
             
             # 删除指定的列
-            columns_to_drop = ['病案号', '门诊号', '住院号', '就诊标识（医渡云计算）', '报告单号']
-            df.drop(columns=columns_to_drop, inplace=True, errors='ignore')
+            df = self._drop_columns(df)
             
             # 删除完全为空的列
             df.dropna(axis=1, how='all', inplace=True)
             
-            return df
+            # 低基数文本列转换为分类类型，缓存中同样以字典编码保存
+            df = self._encode_categories(df)
+            
+            if cache_path:
+                self._write_cache(df, cache_path)
+            
+            return df if columns is None else df[[c for c in columns if c in df.columns]]
         except Exception as e:
             raise Exception(f"数据加载和清理失败: {str(e)}")
     
-    def clean_nan_in_json(self, data):
-        """递归地从字典中去除NaN值，但保留列结构"""
-        if isinstance(data, dict):
-            return {k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self.clean_nan_in_json(item) for item in data]
-        else:
-            return data
-    
-    def remove_none_values(self, data):
-        """去除值为None的键值对"""
-        if isinstance(data, dict):
-            return {k: v for k, v in data.items() if v is not None}
-        elif isinstance(data, list):
-            return [self.remove_none_values(item) for item in data]
+    def load_numeric_columns(self, file_path):
+        """只加载清理后的数值型列"""
+        return self._load_typed_columns(file_path, numeric=True)
+    
+    def load_text_columns(self, file_path):
+        """只加载清理后的文本型列"""
+        return self._load_typed_columns(file_path, numeric=False)
+    
+    def _load_typed_columns(self, file_path, numeric):
+        """按类型加载列：有缓存时只读取所需的列，否则解析一次（同时建立缓存）后从完整表中选取"""
+        cache_path = self._cache_path(file_path)
+        if cache_path and os.path.exists(cache_path):
+            return self.load_and_clean_data(file_path, self._cached_columns(cache_path, numeric))
+        df = self.load_and_clean_data(file_path)
+        selected = df.select_dtypes(include=['number', 'bool']).columns
+        return df[list(selected) if numeric else [c for c in df.columns if c not in selected]]
+    
+    @staticmethod
+    def _cached_columns(cache_path, numeric):
+        """从缓存的表结构中按类型筛选列名"""
+        with pa.memory_map(cache_path) as source:
+            schema = pa.ipc.open_file(source).schema
+        is_numeric = lambda t: pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_boolean(t)
+        return [field.name for field in schema if is_numeric(field.type) == numeric]
+    
+    def _cache_path(self, file_path):
+        """按源文件内容哈希和清理配置计算缓存文件路径，未启用缓存时返回None"""
+        if pa is None or not PROCESSED_CACHE_DIR:
+            return None
+        stat = os.stat(file_path)
+        file_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if file_key in self._cache_paths:
+            return self._cache_paths[file_key]
+        
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        # 影响清理结果的配置均计入缓存键：解析引擎决定列类型，分类编码阈值决定哪些列按字典编码保存；
+        # 假名化密钥变化时患者标识随之变化，缓存需失效（只记录密钥的摘要）
+        config = json.dumps({
+            'drop': self.COLUMNS_TO_DROP,
+            'version': self.CACHE_VERSION,
+            'csv_engine': CSV_ENGINE,
+            'categorical_max_unique_ratio': CATEGORICAL_MAX_UNIQUE_RATIO,
+            'patient_key': hashlib.sha256(PATIENT_KEY_SALT.encode('utf-8')).hexdigest()
+        }, ensure_ascii=False)
+        digest.update(config.encode('utf-8'))
+        cache_path = os.path.join(PROCESSED_CACHE_DIR, f"{digest.hexdigest()}.arrow")
+        self._cache_paths[file_key] = cache_path
+        return cache_path
+    
+    @staticmethod
+    def _write_cache(df, cache_path):
+        """将清理后的表写入未压缩的Arrow IPC文件，便于内存映射读取"""
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # 含混合类型的对象列无法转换为Arrow，跳过缓存
+            return
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        tmp_path = f"{cache_path}.tmp"
+        with pa.OSFile(tmp_path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(tmp_path, cache_path)
+    
+    @staticmethod
+    def _read_cache(cache_path, columns=None):
+        """内存映射读取缓存（零拷贝），只转换需要的列"""
+        with pa.memory_map(cache_path) as source:
+            table = pa.ipc.open_file(source).read_all()
+            if columns is not None:
+                table = table.select([c for c in columns if c in table.column_names])
+            return table.to_pandas()
+    
+    def sniff_source(self, file_path):
+        """识别源文件的格式与编码，返回 (格式, 编码)"""
+        stat = os.stat(file_path)
+        file_key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns)
+        if file_key not in self._source_formats:
+            encoding = detect_encoding(file_path)
+            self._source_formats[file_key] = (detect_format(file_path, encoding), encoding)
+        return self._source_formats[file_key]
+    
+    def _read_source(self, file_path):
+        """整体读取源文件：CSV走多线程解析，JSON Lines分块流式解析"""
+        file_format, encoding = self.sniff_source(file_path)
+        if file_format == 'csv':
+            return self._read_csv(file_path, encoding)
+        if file_format == 'jsonl':
+            return self._read_json_lines(file_path, encoding)
+        return self._read_json(file_path, encoding)
+    
+    def _read_csv(self, file_path, encoding):
+        """使用pyarrow引擎多线程解析CSV，列类型由采样行推断后显式指定"""
+        if pa is None or CSV_ENGINE != 'pyarrow':
+            return pd.read_csv(file_path, encoding=encoding)
+        
+        sample = pd.read_csv(file_path, encoding=encoding, nrows=self.SAMPLE_ROWS)
+        # 浮点列与文本列固定类型，避免pyarrow将文本推断为日期或布尔；
+        # 整数列（后续行可能含空值）和采样中全为空的列交由解析器判断
+        dtypes = {
+            column: dtype for column, dtype in sample.dtypes.items()
+            if sample[column].notna().any()
+            and (pd.api.types.is_float_dtype(dtype) or not pd.api.types.is_numeric_dtype(dtype))
+        }
+        try:
+            return pd.read_csv(file_path, encoding=encoding, engine='pyarrow', dtype=dtypes)
+        except (pa.ArrowInvalid, ValueError):
+            # 采样之外的行与推断类型不符（如数值列中出现文本），回退到默认解析器
+            return pd.read_csv(file_path, encoding=encoding)
+    
+    def _read_json_lines(self, file_path, encoding):
+        """整体读取JSON Lines：UTF-8文件使用pyarrow多线程解析，其余编码分块流式解析"""
+        if pa is None or encoding != 'utf-8':
+            return pd.concat(self._iter_json_lines(file_path, encoding, JSON_CHUNK_ROWS), ignore_index=True)
+        
+        sample = pd.read_json(file_path, lines=True, encoding=encoding, nrows=self.SAMPLE_ROWS,
+                              dtype=False, convert_dates=False)
+        # 文本列显式指定为字符串，避免pyarrow将日期样式的文本推断为时间戳
+        schema = pa.schema([
+            (column, pa.string()) for column in sample.columns
+            if sample[column].notna().any() and not pd.api.types.is_numeric_dtype(sample[column])
+        ])
+        try:
+            table = pa_json.read_json(file_path, parse_options=pa_json.ParseOptions(
+                explicit_schema=schema, unexpected_field_behavior='infer'))
+        except pa.ArrowInvalid:
+            # 采样之外的行与推断类型不符，回退到pandas分块解析
+            return pd.concat(self._iter_json_lines(file_path, encoding, JSON_CHUNK_ROWS), ignore_index=True)
+        # 恢复文件中的列顺序（显式指定类型的列会被排在前面）
+        columns = [c for c in sample.columns if c in table.column_names]
+        columns += [c for c in table.column_names if c not in columns]
+        return table.select(columns).to_pandas()
+    
+    @staticmethod
+    def _read_json(file_path, encoding):
+        """读取JSON记录数组，保留原始值类型"""
+        return pd.read_json(file_path, encoding=encoding, dtype=False, convert_dates=False)
+    
+    @staticmethod
+    def _iter_json_lines(file_path, encoding, chunk_rows):
+        """分块读取JSON Lines文件，内存占用只与块大小有关"""
+        with pd.read_json(file_path, lines=True, encoding=encoding, chunksize=chunk_rows,
+                          dtype=False, convert_dates=False) as reader:
+            yield from reader
+    
+    def _read_sample(self, file_path):
+        """读取前若干行用于估算内存占用"""
+        file_format, encoding = self.sniff_source(file_path)
+        if file_format == 'csv':
+            return pd.read_csv(file_path, encoding=encoding, nrows=self.SAMPLE_ROWS)
+        if file_format == 'jsonl':
+            return pd.read_json(file_path, lines=True, encoding=encoding, nrows=self.SAMPLE_ROWS,
+                                dtype=False, convert_dates=False)
+        return self._read_json(file_path, encoding).head(self.SAMPLE_ROWS)
+    
+    def _iter_source_chunks(self, file_path, chunk_rows):
+        """按块读取源文件；JSON数组无法流式解析，整体作为一块"""
+        file_format, encoding = self.sniff_source(file_path)
+        if file_format == 'csv':
+            with pd.read_csv(file_path, encoding=encoding, chunksize=chunk_rows) as reader:
+                yield from reader
+        elif file_format == 'jsonl':
+            yield from self._iter_json_lines(file_path, encoding, chunk_rows)
         else:
-            return data
-    
-    def separate_data(self, data):
-        """根据值的类型将数据分为json1和json2"""
-        json1 = []
-        json2 = []
-        for record in data:
-            record_json1 = {}
-            record_json2 = {}
-            for key, value in record.items():
-                if isinstance(value, (int, float)) or isinstance(value, bool):
-                    record_json1[key] = value
-                else:
-                    record_json2[key] = value
-            json1.append(record_json1)
-            json2.append(record_json2)
-        return json1, json2
-    
-    def prepare_for_model_summary(self, data):
-        """将json2转换为适合大模型汇总的格式"""
-        model_summary_data = []
-        for record in data:
-            summary_record = {}
-            for key, value in record.items():
-                summary_record[key] = value
-            model_summary_data.append(summary_record)
-        return model_summary_data
+            yield self._read_json(file_path, encoding)
+    
+    def _drop_columns(self, df):
+        """生成假名化患者标识后删除标识列"""
+        patient_keys = self._patient_keys(df)
+        if patient_keys is not None:
+            df[self.PATIENT_KEY_COLUMN] = patient_keys
+        df.drop(columns=self.COLUMNS_TO_DROP, inplace=True, errors='ignore')
+        return df
+    
+    def _patient_keys(self, df):
+        """以HMAC-SHA256对病案号等标识假名化，返回分类类型的患者标识；未配置密钥或没有标识列时返回None"""
+        columns = [column for column in self.PATIENT_ID_COLUMNS if column in df.columns]
+        if not PATIENT_KEY_SALT or not columns:
+            return None
+        # 按优先级合并各标识列（后续列只用于前面各列都缺失的行），以列名为前缀区分不同来源的编号
+        raw_ids = None
+        for column in columns:
+            ids = df[column]
+            if raw_ids is not None:
+                missing = raw_ids.isna()
+                if not missing.any():
+                    break
+                ids = ids[missing]
+            ids = column + ':' + self._normalize_ids(ids)
+            raw_ids = ids if raw_ids is None else raw_ids.fillna(ids)
+        # 每个不同的标识只计算一次摘要
+        codes, uniques = pd.factorize(raw_ids)
+        secret = PATIENT_KEY_SALT.encode('utf-8')
+        digests = [hmac.digest(secret, value.encode('utf-8'), 'sha256').hex()[:self.PATIENT_KEY_LENGTH]
+                   for value in uniques.tolist()]
+        return pd.Categorical.from_codes(codes, digests)
+    
+    @staticmethod
+    def _normalize_ids(series):
+        """将标识列统一为字符串；含缺失值的整数编号会被读成浮点数，先转回整数避免出现“123.0”"""
+        if pd.api.types.is_float_dtype(series.dtype) and (series.dropna() % 1 == 0).all():
+            series = series.astype('Int64')
+        return series.astype('string')
+    
+    @staticmethod
+    def _encode_categories(df):
+        """将重复取值多的文本列（如诊断、科室、性别）转换为分类类型，每个取值只保存一份"""
+        if CATEGORICAL_MAX_UNIQUE_RATIO <= 0:
+            return df
+        for column in df.columns:
+            series = df[column]
+            if isinstance(series.dtype, pd.CategoricalDtype) or not is_text_column(series):
+                continue
+            categorical = series.astype('category')
+            if len(categorical.cat.categories) <= series.count() * CATEGORICAL_MAX_UNIQUE_RATIO:
+                df[column] = categorical
+        return df
+    
+    def estimate_chunk_rows(self, file_path, memory_limit_mb=None):
+        """根据内存上限估算每块读取的行数"""
+        if memory_limit_mb is None:
+            memory_limit_mb = STREAM_MEMORY_LIMIT_MB
+        sample = self._read_sample(file_path)
+        if len(sample) == 0:
+            return self.SAMPLE_ROWS
+        
+        # 采样行的平均内存占用（含字符串对象），乘以处理过程中的副本数
+        bytes_per_row = sample.memory_usage(deep=True).sum() / len(sample)
+        bytes_per_row = max(bytes_per_row * self.CHUNK_COPY_FACTOR, 1)
+        return max(int(memory_limit_mb * 1024 * 1024 // bytes_per_row), 1)
     
+    def iter_process_data(self, file_path, memory_limit_mb=None):
+        """流式数据处理：按内存上限分块读取CSV/JSON Lines，逐块产出处理结果"""
+        try:
+            chunk_rows = self.estimate_chunk_rows(file_path, memory_limit_mb)
+            for chunk in self._iter_source_chunks(file_path, chunk_rows):
+                # 逐块删除标识列；全空列无需单独处理，空值会在记录清理时去除
+                chunk = self._encode_categories(self._drop_columns(chunk))
+                yield self._process_frame(chunk)
+        except Exception as e:
+            raise Exception(f"流式数据处理失败: {str(e)}")
+    
+    def process_data_to_disk(self, file_path, output_dir, memory_limit_mb=None):
+        """流式数据处理：将结果逐块写入JSON Lines文件，返回文件路径"""
+        try:
+            os.makedirs(output_dir, exist_ok=True)
+            json1_path = os.path.join(output_dir, 'json1.jsonl')
+            json2_path = os.path.join(output_dir, 'json2.jsonl')
+            total_rows = 0
+            
+            with open(json1_path, 'w', encoding='utf-8') as f1, \
+                    open(json2_path, 'w', encoding='utf-8') as f2:
+                for result in self.iter_process_data(file_path, memory_limit_mb):
+                    for record in result['json1']:
+                        f1.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    for record in result['json2']:
+                        f2.write(json.dumps(record, ensure_ascii=False) + '\n')
+                    total_rows += len(result['json1'])
+            
+            return {
+                'json1': json1_path,
+                'json2': json2_path,
+                'total_rows': total_rows
+            }
+        except Exception as e:
+            raise Exception(f"数据落盘失败: {str(e)}")
+    
+    @profiled('process_data', measure=lambda result: {
+        'rows': len(result['json1']),
+        'columns': result['json1'].frame.shape[1] + result['json2'].frame.shape[1]
+    })
     def process_data(self, file_path):
         """完整的数据处理流程"""
         try:
             # 1. 加载和清理数据
             df = self.load_and_clean_data(file_path)
             
-            # 2. 转换为字典列表
-            json_dict = df.to_dict(orient='records')
-            
-            # 3. 清理NaN值
-            cleaned_dict = [self.clean_nan_in_json(record) for record in json_dict]
-            
-            # 4. 去除None值
-            cleaned_dict_no_none = [self.remove_none_values(record) for record in cleaned_dict]
-            
-            # 5. 分离数据
-            self.json1, self.json2 = self.separate_data(cleaned_dict_no_none)
-            
-            # 6. 准备模型汇总数据
-            model_summary_data = self.prepare_for_model_summary(self.json2)
-            
-            return {
-                'json1': self.json1,
-                'json2': self.json2,
-                'model_summary_data': model_summary_data
-            }
+            return self._process_frame(df)
         except Exception as e:
-            raise Exception(f"数据处理失败: {str(e)}")
\ No newline at end of file
+            raise Exception(f"数据处理失败: {str(e)}")
+    
+    @profiled('process_frame', measure=lambda result: {'rows': len(result['json1'])})
+    def _process_frame(self, df):
+        """列式处理：按列类型分离数据，DataFrame作为规范表示，字典记录按需生成"""
+        # 2. 按列的数据类型分离（数值/布尔列 → json1，其余列 → json2）
+        numeric_columns = df.select_dtypes(include=['number', 'bool']).columns
+        numeric_df = df[numeric_columns]
+        text_df = df.drop(columns=numeric_columns)
+        
+        # 3. NaN/None值在生成记录时按掩码去除，无需逐条复制
+        self.json1 = RecordView(numeric_df)
+        self.json2 = RecordView(text_df)
+        
+        # 4. 模型汇总数据与json2共享同一只读视图
+        return {
+            'json1': self.json1,
+            'json2': self.json2,
+            'model_summary_data': self.json2
+        }
\ No newline at end of file
@@ -1,13 +1,62 @@
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
 import matplotlib.pyplot as plt
 import seaborn as sns
 import pandas as pd
 import numpy as np
 from wordcloud import WordCloud
+from data_processor import to_frame, value_counts
+from diagnosis_terms import get_term_index
+from temporal import get_time_indexes, FREQUENCY_LABELS
+from profiling import span, profiled
+from plot_aggregation import histogram_bins, box_statistics
+from config import PLOT_POINTS_BUDGET, PLOT_MAX_BINS, EXPORT_MAX_WORKERS, TEMPORAL_ROLLING_WINDOW
+import hashlib
+import json
+import os
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import warnings
 warnings.filterwarnings('ignore')
 
+class LazyFigures(Mapping):
+    """图表注册表：每个图表登记为延迟构建函数，首次访问时才构建并缓存结果"""
+
+    def __init__(self):
+        self._builders = {}
+        self._figures = {}
+
+    def register(self, name, builder, *args):
+        """登记图表的构建函数及参数"""
+        self._builders[name] = partial(builder, *args)
+
+    def __getitem__(self, name):
+        if name not in self._figures:
+            builder = self._builders[name]
+            try:
+                with span('build_figure', figure=name):
+                    self._figures[name] = builder()
+            except Exception as e:
+                raise Exception(f"创建图表{name}失败: {str(e)}")
+        return self._figures[name]
+
+    def __contains__(self, name):
+        # 只检查是否登记，Mapping默认实现会调用__getitem__触发构建
+        return name in self._builders
+
+    def __iter__(self):
+        return iter(self._builders)
+
+    def __len__(self):
+        return len(self._builders)
+
+    def is_built(self, name):
+        return name in self._figures
+
+
 class DataVisualizer:
     def __init__(self):
         # 设置中文字体
@@ -20,152 +69,291 @@ class DataVisualizer:
     def create_numeric_visualizations(self, json1):
         """创建数值型数据的可视化"""
         try:
-            df = pd.DataFrame(json1)
-            visualizations = {}
+            df = to_frame(json1)
+            visualizations = LazyFigures()
             
             # 1. 箱线图
-            fig_box = go.Figure()
-            for column in df.columns:
-                fig_box.add_trace(go.Box(y=df[column], name=column))
-            fig_box.update_layout(
-                title='数值变量分布箱线图',
-                template=self.template
-            )
-            visualizations['box_plot'] = fig_box
+            visualizations.register('box_plot', self._build_box_plot, df)
             
             # 2. 直方图
-            fig_hist = go.Figure()
-            for column in df.columns:
-                fig_hist.add_trace(go.Histogram(x=df[column], name=column))
-            fig_hist.update_layout(
-                title='数值变量分布直方图',
-                template=self.template,
-                barmode='overlay'
-            )
-            visualizations['histogram'] = fig_hist
+            visualizations.register('histogram', self._build_histogram, df)
             
             # 3. 相关性热力图
-            corr_matrix = df.corr()
-            fig_heatmap = go.Figure(data=go.Heatmap(
-                z=corr_matrix,
-                x=corr_matrix.columns,
-                y=corr_matrix.columns,
-                colorscale='RdBu'
-            ))
-            fig_heatmap.update_layout(
-                title='数值变量相关性热力图',
-                template=self.template
-            )
-            visualizations['heatmap'] = fig_heatmap
+            visualizations.register('heatmap', self._build_heatmap, df)
             
             return visualizations
         except Exception as e:
             raise Exception(f"创建数值型数据可视化失败: {str(e)}")
     
+    def _build_box_plot(self, df):
+        """数值变量分布箱线图（只传输四分位数、须线和抽样后的异常点）"""
+        fig_box = go.Figure()
+        max_outliers = max(PLOT_POINTS_BUDGET // max(len(df.columns), 1), 1)
+        for column in df.columns:
+            self._add_box_trace(fig_box, df[column], column, max_outliers)
+        fig_box.update_layout(
+            title='数值变量分布箱线图',
+            template=self.template,
+            showlegend=False
+        )
+        return fig_box
+    
+    def _add_box_trace(self, fig, values, name, max_outliers):
+        """添加预计算统计量的箱线，异常点以散点单独绘制"""
+        box = box_statistics(values, max_outliers)
+        if box is None:
+            return
+        fig.add_trace(go.Box(
+            x=[name], name=name,
+            q1=[box['q1']], median=[box['median']], q3=[box['q3']],
+            lowerfence=[box['lowerfence']], upperfence=[box['upperfence']], mean=[box['mean']]
+        ))
+        if len(box['outliers']):
+            fig.add_trace(go.Scatter(
+                x=[name] * len(box['outliers']), y=box['outliers'],
+                mode='markers', name=f'{name}异常值', marker={'size': 4}
+            ))
+    
+    def _build_histogram(self, df):
+        """数值变量分布直方图（服务端预先分箱）"""
+        fig_hist = go.Figure()
+        max_bins = max(min(PLOT_MAX_BINS, PLOT_POINTS_BUDGET // max(len(df.columns), 1)), 1)
+        for column in df.columns:
+            centers, widths, counts = histogram_bins(df[column], max_bins)
+            fig_hist.add_trace(go.Bar(x=centers, y=counts, width=widths, name=column, opacity=0.6))
+        fig_hist.update_layout(
+            title='数值变量分布直方图',
+            template=self.template,
+            barmode='overlay'
+        )
+        return fig_hist
+    
+    def _build_heatmap(self, df):
+        """数值变量相关性热力图"""
+        corr_matrix = df.corr()
+        fig_heatmap = go.Figure(data=go.Heatmap(
+            z=corr_matrix,
+            x=corr_matrix.columns,
+            y=corr_matrix.columns,
+            colorscale='RdBu'
+        ))
+        fig_heatmap.update_layout(
+            title='数值变量相关性热力图',
+            template=self.template
+        )
+        return fig_heatmap
+    
     def create_diagnosis_visualizations(self, json2):
         """创建诊断数据的可视化"""
         try:
-            df = pd.DataFrame(json2)
-            visualizations = {}
+            df = to_frame(json2)
+            visualizations = LazyFigures()
             
-            # 1. 诊断频率柱状图
             if '病理诊断（病案首页）' in df.columns:
-                diagnosis_counts = df['病理诊断（病案首页）'].value_counts().head(10)
-                fig_bar = px.bar(
-                    x=diagnosis_counts.index,
-                    y=diagnosis_counts.values,
-                    title='前10位诊断频率分布',
-                    labels={'x': '诊断', 'y': '频次'}
-                )
-                fig_bar.update_layout(template=self.template)
-                visualizations['diagnosis_bar'] = fig_bar
-            
-            # 2. 诊断词云
-            if '病理诊断（病案首页）' in df.columns:
-                text = ' '.join(df['病理诊断（病案首页）'].dropna())
-                wordcloud = WordCloud(
-                    font_path='simhei.ttf',
-                    width=800,
-                    height=400,
-                    background_color='white'
-                ).generate(text)
+                # 1. 诊断频率柱状图
+                visualizations.register('diagnosis_bar', self._build_diagnosis_bar, df)
                 
-                fig_wordcloud = go.Figure()
-                fig_wordcloud.add_trace(go.Image(z=wordcloud.to_array()))
-                fig_wordcloud.update_layout(
-                    title='诊断词云',
-                    template=self.template
-                )
-                visualizations['wordcloud'] = fig_wordcloud
+                # 2. 诊断词云
+                visualizations.register('wordcloud', self._build_wordcloud, json2)
             
             return visualizations
         except Exception as e:
             raise Exception(f"创建诊断数据可视化失败: {str(e)}")
     
-    def create_temporal_visualizations(self, json1):
-        """创建时间序列数据的可视化"""
+    def _build_diagnosis_bar(self, df):
+        """前10位诊断频率柱状图"""
+        diagnosis_counts = value_counts(df['病理诊断（病案首页）']).head(10)
+        fig_bar = px.bar(
+            x=diagnosis_counts.index,
+            y=diagnosis_counts.values,
+            title='前10位诊断频率分布',
+            labels={'x': '诊断', 'y': '频次'}
+        )
+        fig_bar.update_layout(template=self.template)
+        return fig_bar
+    
+    def _build_wordcloud(self, json2):
+        """诊断词云（直接使用诊断词项索引的词频，不再拼接全部文本重新分词）"""
+        frequencies = get_term_index(json2).term_frequencies().to_dict()
+        wordcloud = WordCloud(
+            font_path='simhei.ttf',
+            width=800,
+            height=400,
+            background_color='white'
+        ).generate_from_frequencies(frequencies)
+        
+        fig_wordcloud = go.Figure()
+        fig_wordcloud.add_trace(go.Image(z=wordcloud.to_array()))
+        fig_wordcloud.update_layout(
+            title='诊断词云',
+            template=self.template
+        )
+        return fig_wordcloud
+    
+    def create_temporal_visualizations(self, json1, json2):
+        """创建时间序列数据的可视化（日期列位于json2，检验指标位于json1）"""
         try:
-            df = pd.DataFrame(json1)
-            visualizations = {}
+            visualizations = LazyFigures()
             
-            # 1. 时间趋势图
-            for column in df.columns:
-                if 'date' in column.lower() or 'time' in column.lower():
-                    fig_trend = px.line(
-                        df,
-                        x=column,
-                        y=df.select_dtypes(include=[np.number]).columns,
-                        title=f'{column}趋势图'
-                    )
-                    fig_trend.update_layout(template=self.template)
-                    visualizations[f'trend_{column}'] = fig_trend
+            # 1. 时间趋势图（与时间趋势分析共用同一时间索引）
+            for column, index in get_time_indexes(json1, json2).items():
+                visualizations.register(f'trend_{column}', self._build_trend, index, column)
             
             return visualizations
         except Exception as e:
             raise Exception(f"创建时间序列数据可视化失败: {str(e)}")
     
+    def _build_trend(self, index, column):
+        """时间趋势图：在点数预算内选择最细的日/周/月粒度，柱状为记录数，折线为各检验指标的滚动均值"""
+        for freq in ('D', 'W', 'M'):
+            aggregate = index.aggregate(freq)
+            if len(aggregate.counts) * (len(index.columns) + 1) <= PLOT_POINTS_BUDGET:
+                break
+        means = aggregate.rolling_means()
+        
+        fig_trend = go.Figure()
+        fig_trend.add_trace(go.Bar(x=aggregate.counts.index, y=aggregate.counts.to_numpy(),
+                                   name='记录数', yaxis='y2', opacity=0.3))
+        for series in means.columns:
+            fig_trend.add_trace(go.Scatter(x=means.index, y=means[series].to_numpy(), mode='lines', name=series))
+        fig_trend.update_layout(
+            title=f'{column}趋势图（按{FREQUENCY_LABELS[aggregate.freq]}，{TEMPORAL_ROLLING_WINDOW}期滚动均值）',
+            template=self.template,
+            yaxis2={'title': '记录数', 'overlaying': 'y', 'side': 'right', 'showgrid': False}
+        )
+        return fig_trend
+    
     def create_comparison_visualizations(self, json1, json2):
         """创建对比分析的可视化"""
         try:
-            df1 = pd.DataFrame(json1)
-            df2 = pd.DataFrame(json2)
-            visualizations = {}
+            df1 = to_frame(json1)
+            df2 = to_frame(json2)
+            visualizations = LazyFigures()
             
             # 1. 数值型变量与诊断的关联分析
             if '病理诊断（病案首页）' in df2.columns:
                 for column in df1.columns:
-                    fig_box = px.box(
-                        pd.concat([df1[column], df2['病理诊断（病案首页）']], axis=1),
-                        x='病理诊断（病案首页）',
-                        y=column,
-                        title=f'{column}与诊断的分布关系'
-                    )
-                    fig_box.update_layout(template=self.template)
-                    visualizations[f'comparison_{column}'] = fig_box
+                    visualizations.register(f'comparison_{column}', self._build_comparison, df1, df2, column)
             
             return visualizations
         except Exception as e:
             raise Exception(f"创建对比分析可视化失败: {str(e)}")
     
+    def _build_comparison(self, df1, df2, column):
+        """数值型变量与诊断的分布关系箱线图（按诊断分组预计算统计量）"""
+        fig_box = go.Figure()
+        groups = df1[column].groupby(df2['病理诊断（病案首页）'], sort=False)
+        max_outliers = max(PLOT_POINTS_BUDGET // max(groups.ngroups, 1), 1)
+        for diagnosis, values in groups:
+            self._add_box_trace(fig_box, values, diagnosis, max_outliers)
+        fig_box.update_layout(
+            title=f'{column}与诊断的分布关系',
+            template=self.template,
+            xaxis_title='病理诊断（病案首页）',
+            yaxis_title=column,
+            showlegend=False
+        )
+        return fig_box
+    
+    @profiled('create_all_visualizations')
     def create_all_visualizations(self, json1, json2):
-        """创建所有可视化"""
+        """创建所有可视化（各图表在首次访问时才构建）"""
         try:
             all_visualizations = {
                 'numeric': self.create_numeric_visualizations(json1),
                 'diagnosis': self.create_diagnosis_visualizations(json2),
-                'temporal': self.create_temporal_visualizations(json1),
+                'temporal': self.create_temporal_visualizations(json1, json2),
                 'comparison': self.create_comparison_visualizations(json1, json2)
             }
             return all_visualizations
         except Exception as e:
             raise Exception(f"创建可视化失败: {str(e)}")
     
-    def save_visualizations(self, visualizations, output_dir):
-        """保存可视化结果"""
+    def create_waterfall(self, spans):
+        """剖析区间瀑布图：横条起点为相对调用链开始的时间，长度为墙钟耗时"""
+        origin = min(record['started_at'] for record in spans)
+        labels = [f"{'　' * record['depth']}{record['name']}"
+                  f"{' · ' + str(record['figure']) if 'figure' in record else ''} #{record['span_id']}"
+                  for record in spans]
+        hover = [
+            f"墙钟 {record['wall_seconds']:.3f}s<br>CPU {record['cpu_seconds']:.3f}s<br>"
+            f"峰值内存增量 {(record['peak_rss_delta'] or 0) / 1024 / 1024:.1f} MB<br>"
+            f"线程 {record['thread']}"
+            + (f"<br>行数 {record['rows']}" if 'rows' in record else '')
+            + (f"<br>首字延迟 {record['time_to_first_token']:.3f}s" if 'time_to_first_token' in record else '')
+            + (f"<br>生成速度 {record['tokens_per_second']:.1f} token/s" if 'tokens_per_second' in record else '')
+            for record in spans
+        ]
+        fig = go.Figure(go.Bar(
+            y=labels,
+            x=[record['wall_seconds'] for record in spans],
+            base=[record['started_at'] - origin for record in spans],
+            orientation='h',
+            hovertext=hover,
+            hoverinfo='text'
+        ))
+        fig.update_layout(
+            title='各阶段耗时瀑布图',
+            template=self.template,
+            xaxis_title='时间（秒）',
+            yaxis={'autorange': 'reversed'},
+            height=max(300, 28 * len(spans) + 120)
+        )
+        return fig
+    
+    @profiled('save_visualizations', measure=lambda exported: {'exported': len(exported)})
+    def save_visualizations(self, visualizations, output_dir, max_workers=None, export_png=True):
+        """保存可视化结果：跳过内容未变化的图表，HTML并行写出并共享同一份plotly.js，PNG批量渲染"""
         try:
+            os.makedirs(output_dir, exist_ok=True)
+            manifest_path = os.path.join(output_dir, 'export_manifest.json')
+            manifest = {}
+            if os.path.exists(manifest_path):
+                with open(manifest_path, encoding='utf-8') as f:
+                    manifest = json.load(f)
+            
+            # 按图表内容哈希筛选需要导出的图表
+            changed = []
             for category, category_visualizations in visualizations.items():
                 for name, fig in category_visualizations.items():
-                    fig.write_html(f"{output_dir}/{category}_{name}.html")
-                    fig.write_image(f"{output_dir}/{category}_{name}.png")
+                    base_name = f"{category}_{name}"
+                    html_path = os.path.join(output_dir, f"{base_name}.html")
+                    png_path = os.path.join(output_dir, f"{base_name}.png")
+                    digest = hashlib.sha256(fig.to_json().encode('utf-8')).hexdigest()
+                    up_to_date = (manifest.get(base_name) == digest and os.path.exists(html_path)
+                                  and (not export_png or os.path.exists(png_path)))
+                    if not up_to_date:
+                        changed.append((base_name, fig, html_path, png_path, digest))
+            
+            if changed:
+                # plotly.js只写入一次，所有HTML通过相对路径引用
+                bundle_path = os.path.join(output_dir, 'plotly.min.js')
+                if not os.path.exists(bundle_path):
+                    with open(bundle_path, 'w', encoding='utf-8') as f:
+                        f.write(get_plotlyjs())
+                
+                with ThreadPoolExecutor(max_workers=max_workers or EXPORT_MAX_WORKERS) as executor:
+                    list(executor.map(
+                        lambda item: item[1].write_html(item[2], include_plotlyjs='directory'),
+                        changed
+                    ))
+                
+                if export_png:
+                    self._write_images([item[1] for item in changed], [item[3] for item in changed])
+                
+                manifest.update({item[0]: item[4] for item in changed})
+                with open(manifest_path, 'w', encoding='utf-8') as f:
+                    json.dump(manifest, f, ensure_ascii=False, indent=2)
+            
+            return [item[0] for item in changed]
         except Exception as e:
-            raise Exception(f"保存可视化结果失败: {str(e)}")
\ No newline at end of file
+            raise Exception(f"保存可视化结果失败: {str(e)}")
+    
+    @staticmethod
+    def _write_images(figures, paths):
+        """批量导出PNG：新版plotly复用同一个Kaleido渲染进程并发导出，旧版逐个导出"""
+        if hasattr(pio, 'write_images'):
+            pio.write_images(figures, paths)
+        else:
+            for fig, path in zip(figures, paths):
+                fig.write_image(path)
@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import Counter
+from config import DATASET_LEASE_TTL_SECONDS
+
+
+class DatasetStore:
+    """进程级共享数据集存储：同一数据集只保存一份，会话只持有数据集键
+
+    会话通过租约使用数据集：租约期间数据集在结果缓存中被固定、不会被淘汰；
+    会话切换数据集、主动释放或超过租约有效期未续约后取消固定，数据集恢复参与LRU淘汰。
+    """
+
+    def __init__(self, result_cache, lease_ttl=DATASET_LEASE_TTL_SECONDS):
+        self.cache = result_cache
+        self.lease_ttl = lease_ttl
+        self._leases = {}  # session_id -> (key, 到期时间)
+        self._build_locks = {}  # key -> 构建锁，同一数据集同时只构建一次
+        self._lock = threading.Lock()
+
+    def acquire(self, key, session_id):
+        """获取数据集并为会话续约，数据集不存在时返回None"""
+        value = self.cache.get(key)
+        if value is not None:
+            self._lease(key, session_id)
+        return value
+
+    def acquire_or_build(self, key, session_id, build, size=None):
+        """获取数据集，不存在时调用build构建；多个会话同时请求同一数据集时只构建一次
+
+        size为调用方已知的数据集大小（字节），未给出时由结果缓存估算。
+        """
+        value = self.acquire(key, session_id)
+        if value is not None:
+            return value
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            # 等待期间其他会话可能已完成构建
+            value = self.acquire(key, session_id)
+            if value is None:
+                value = build()
+                self.put(key, value, session_id, size)
+        with self._lock:
+            self._build_locks.pop(key, None)
+        return value
+
+    def put(self, key, value, session_id, size=None):
+        """存入数据集并为会话建立租约"""
+        self.cache.put(key, value, size)
+        self._lease(key, session_id)
+
+    def release(self, session_id):
+        """释放会话持有的租约"""
+        with self._lock:
+            lease = self._leases.pop(session_id, None)
+            if lease is not None:
+                self.cache.unpin(lease[0])
+
+    def refcount(self, key):
+        """当前使用该数据集的会话数"""
+        self._expire_leases()
+        with self._lock:
+            return sum(1 for lease_key, _ in self._leases.values() if lease_key == key)
+
+    def stats(self):
+        """返回会话数、被使用的数据集数与缓存占用"""
+        self._expire_leases()
+        with self._lock:
+            sessions_per_dataset = Counter(key for key, _ in self._leases.values())
+        return {
+            'sessions': sum(sessions_per_dataset.values()),
+            'datasets_in_use': len(sessions_per_dataset),
+            'cache_bytes': self.cache.total_bytes
+        }
+
+    def _lease(self, key, session_id):
+        """建立或续约租约；会话切换数据集时取消对原数据集的固定"""
+        self._expire_leases()
+        with self._lock:
+            previous = self._leases.get(session_id)
+            self._leases[session_id] = (key, time.monotonic() + self.lease_ttl)
+            # 固定计数与租约在同一把锁内更新（锁顺序：存储锁 → 缓存锁）
+            if previous is None or previous[0] != key:
+                self.cache.pin(key)
+                if previous is not None:
+                    self.cache.unpin(previous[0])
+
+    def _expire_leases(self):
+        """清理过期租约（会话关闭时不会通知服务端，依靠租约到期回收）"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [session_id for session_id, (_, expires_at) in self._leases.items() if expires_at <= now]
+            for session_id in expired:
+                self.cache.unpin(self._leases.pop(session_id)[0])
@@ -0,0 +1,121 @@
+"""诊断词项索引：按中文标点和ICD编码切分诊断，统计词频并保留倒排表用于检索"""
+
+import math
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from data_processor import RecordView, to_frame
+from config import DIAGNOSIS_INDEX_WORKERS, DIAGNOSIS_INDEX_PARALLEL_MIN
+
+DIAGNOSIS_COLUMN = '病理诊断（病案首页）'
+
+# ICD-10编码（含国家临床版扩展码，如 C34.1、C50.900x001），连同包围编码的括号一起匹配
+ICD_CODE_PATTERN = re.compile(
+    r'[(（\[【]?\s*((?<![A-Za-z0-9])[A-Z]\d{2}(?:\.[0-9A-Za-z]{1,8})?(?![A-Za-z0-9]))\s*[)）\]】]?')
+# 词项：分隔符（中英文逗号、顿号、分号、句号、空白）之间的文本；\x1f 用于分隔批量拼接的各个取值
+TERM_PATTERN = re.compile(r'\x1f|[^，,、；;。\s]+')
+
+
+def split_terms(text):
+    """将一条诊断切分为词项：ICD编码单独成项，其余按中文标点切分"""
+    return _split_values([text])[0]
+
+
+def _split_values(values):
+    """批量分词，返回（扁平词项列表，每个取值的词项数）；进程池任务，需定义在模块级
+
+    所有取值拼接为一个字符串后只做一次正则替换和查找，避免逐条调用正则。
+    """
+    text = '\x1f'.join(str(value).replace('\x1f', '') for value in values)
+    # ICD编码替换为两侧带空格的编码本身（去掉括号），使其成为独立词项
+    text = ICD_CODE_PATTERN.sub(lambda match: f' {match[1]} ', text)
+    tokens = np.asarray(TERM_PATTERN.findall(text), dtype=object)
+    # 按取值分隔标记统计每个取值的词项数
+    is_marker = tokens == '\x1f'
+    value_ids = np.cumsum(is_marker)[~is_marker]
+    lengths = np.bincount(value_ids, minlength=len(values)).tolist()
+    return tokens[~is_marker].tolist(), lengths
+
+
+class DiagnosisTermIndex:
+    """诊断词项索引：只对不同的诊断取值分词，词频按取值出现次数加权"""
+
+    def __init__(self, series, max_workers=None):
+        # 行 → 诊断取值编号；分类列直接复用已有编码
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            self.codes = series.cat.codes.to_numpy()
+            self.values = series.cat.categories
+        else:
+            self.codes, self.values = pd.factorize(series)
+        value_counts = np.bincount(self.codes[self.codes >= 0], minlength=len(self.values))
+
+        flat_terms, lengths = self._split_all(self.values.tolist(), max_workers or DIAGNOSIS_INDEX_WORKERS)
+
+        # 词项编号与所属取值编号的扁平数组
+        flat_terms, terms = pd.factorize(np.asarray(flat_terms, dtype=object))
+        owners = np.repeat(np.arange(len(lengths)), lengths)
+
+        self.terms = np.asarray(terms, dtype=object)
+        self.term_ids = dict(zip(self.terms, range(len(self.terms))))
+        self.frequencies = np.bincount(flat_terms, weights=value_counts[owners],
+                                       minlength=len(self.terms)).astype(np.int64)
+
+        # 倒排表（CSR格式）：词项 → 包含该词项的诊断取值编号
+        order = np.argsort(flat_terms, kind='stable')
+        self._posting_values = owners[order]
+        self._posting_offsets = np.searchsorted(flat_terms[order], np.arange(len(self.terms) + 1))
+
+    @staticmethod
+    def _split_all(values, max_workers):
+        """分块分词；不同取值较多时使用多进程并行（正则切分受GIL限制，线程无法加速）"""
+        max_workers = min(max_workers, os.cpu_count() or 1)
+        if max_workers <= 1 or len(values) < DIAGNOSIS_INDEX_PARALLEL_MIN:
+            return _split_values(values)
+        chunk_size = math.ceil(len(values) / (max_workers * 4))
+        chunks = [values[start:start + chunk_size] for start in range(0, len(values), chunk_size)]
+        flat_terms = []
+        lengths = []
+        # 调用方可能在分析线程池中，以spawn方式启动子进程，避免fork多线程进程导致死锁
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            for chunk_terms, chunk_lengths in executor.map(_split_values, chunks):
+                flat_terms.extend(chunk_terms)
+                lengths.extend(chunk_lengths)
+        return flat_terms, lengths
+
+    def term_frequencies(self):
+        """全部词项的出现次数（降序）"""
+        order = np.argsort(-self.frequencies, kind='stable')
+        return pd.Series(self.frequencies[order], index=self.terms[order], name='count')
+
+    def top_terms(self, n):
+        """出现次数最多的n个词项"""
+        return self.term_frequencies().head(n).to_dict()
+
+    def rows_with_term(self, term):
+        """包含该词项的行下标"""
+        term_id = self.term_ids.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.intp)
+        value_ids = self._posting_values[self._posting_offsets[term_id]:self._posting_offsets[term_id + 1]]
+        return np.flatnonzero(np.isin(self.codes, value_ids))
+
+    def search(self, query):
+        """返回诊断中含有包含query的词项的行下标（如“腺癌”匹配“肺腺癌”“胃腺癌”）"""
+        matched = [term_id for term, term_id in self.term_ids.items() if query in term]
+        if not matched:
+            return np.empty(0, dtype=np.intp)
+        value_ids = np.concatenate([
+            self._posting_values[self._posting_offsets[term_id]:self._posting_offsets[term_id + 1]]
+            for term_id in matched
+        ])
+        return np.flatnonzero(np.isin(self.codes, value_ids))
+
+
+def get_term_index(data, column=DIAGNOSIS_COLUMN):
+    """获取数据集的诊断词项索引；记录视图上按列缓存，同一数据集只构建一次"""
+    if isinstance(data, RecordView):
+        return data.cached(('diagnosis_terms', column), lambda frame: DiagnosisTermIndex(frame[column]))
+    return DiagnosisTermIndex(to_frame(data)[column])
@@ -0,0 +1,76 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import (HTTP_POOL_SIZE, HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT,
+                    HTTP_MAX_RETRIES, HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX)
+
+
+class PooledHTTPClient:
+    """共享连接池的HTTP客户端：keep-alive连接复用、超时与带抖动的指数退避重试"""
+    # 需要重试的HTTP状态码
+    RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+    def __init__(self, pool_size=HTTP_POOL_SIZE, connect_timeout=HTTP_CONNECT_TIMEOUT,
+                 read_timeout=HTTP_READ_TIMEOUT, max_retries=HTTP_MAX_RETRIES,
+                 backoff_base=HTTP_BACKOFF_BASE, backoff_max=HTTP_BACKOFF_MAX):
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+        # 重试由本类处理，连接池只负责复用连接
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def post(self, url, headers=None, json=None, stream=False):
+        """发送POST请求，对连接错误、超时和429/5xx响应进行重试"""
+        for attempt in range(self.max_retries + 1):
+            is_last_attempt = attempt == self.max_retries
+            try:
+                response = self.session.post(
+                    url, headers=headers, json=json, stream=stream, timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                if is_last_attempt:
+                    raise
+                time.sleep(self._backoff_delay(attempt))
+                continue
+
+            if response.status_code in self.RETRY_STATUS_CODES and not is_last_attempt:
+                retry_after = response.headers.get('Retry-After')
+                response.close()
+                time.sleep(self._backoff_delay(attempt, retry_after))
+                continue
+
+            response.raise_for_status()
+            return response
+
+    def _backoff_delay(self, attempt, retry_after=None):
+        """计算重试等待时间：优先遵循Retry-After，否则使用全抖动指数退避"""
+        if retry_after is not None:
+            try:
+                return min(float(retry_after), self.backoff_max)
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def close(self):
+        self.session.close()
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """获取进程内共享的HTTP客户端"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = PooledHTTPClient()
+    return _client
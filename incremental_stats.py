@@ -0,0 +1,372 @@
+"""可合并的汇总统计结构，用于对持续追加的数据做增量分析
+
+误差说明（与全量重新计算相比）：
+- 计数、均值、标准差、最小/最大值、相关系数、文本取值计数、诊断频率：精确（仅有浮点舍入误差）
+- 分位数（25%/50%/75%）：数据量不超过草图容量时精确；之后为KLL草图近似，
+  秩误差约为 ±1.7/k（k=INCREMENTAL_SKETCH_K，默认1000时约 ±0.2%）
+- 异常值数量：由分位数草图估计，误差不超过 2 × 秩误差 × 总行数
+- 时间趋势：保存各日期列的按日聚合，精确
+"""
+
+import math
+import os
+import pickle
+from collections import Counter
+import numpy as np
+from data_processor import to_frame, value_counts
+from diagnosis_terms import get_term_index
+from temporal import get_time_indexes, summarize_trend
+from config import INCREMENTAL_SKETCH_K
+
+
+class RunningMoments:
+    """逐列的计数、均值、二阶中心矩（Welford/Chan合并）及最小/最大值"""
+
+    def __init__(self, n_cols=0):
+        self.count = np.zeros(n_cols)
+        self.mean = np.zeros(n_cols)
+        self.m2 = np.zeros(n_cols)
+        self.min = np.full(n_cols, np.nan)
+        self.max = np.full(n_cols, np.nan)
+
+    @classmethod
+    def from_values(cls, values):
+        moments = cls(values.shape[1])
+        valid = ~np.isnan(values)
+        moments.count = valid.sum(axis=0).astype(np.float64)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            moments.mean = np.where(moments.count > 0,
+                                    np.where(valid, values, 0.0).sum(axis=0) / moments.count, 0.0)
+            moments.m2 = (np.where(valid, values - moments.mean, 0.0) ** 2).sum(axis=0)
+        has_values = moments.count > 0
+        moments.min[has_values] = np.nanmin(values[:, has_values], axis=0)
+        moments.max[has_values] = np.nanmax(values[:, has_values], axis=0)
+        return moments
+
+    def grow(self, n_new):
+        self.count = np.concatenate([self.count, np.zeros(n_new)])
+        self.mean = np.concatenate([self.mean, np.zeros(n_new)])
+        self.m2 = np.concatenate([self.m2, np.zeros(n_new)])
+        self.min = np.concatenate([self.min, np.full(n_new, np.nan)])
+        self.max = np.concatenate([self.max, np.full(n_new, np.nan)])
+
+    def merge(self, other, index):
+        """将other合并到index指定的列上（Chan并行合并公式）"""
+        n_a, n_b = self.count[index], other.count
+        total = n_a + n_b
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = other.mean - self.mean[index]
+            self.mean[index] = np.where(total > 0, self.mean[index] + delta * n_b / total, 0.0)
+            self.m2[index] = self.m2[index] + other.m2 + np.where(total > 0, delta ** 2 * n_a * n_b / total, 0.0)
+        self.count[index] = total
+        self.min[index] = np.fmin(self.min[index], other.min)
+        self.max[index] = np.fmax(self.max[index], other.max)
+
+    def std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > 1, np.sqrt(self.m2 / np.maximum(self.count - 1, 1)), np.nan)
+
+
+class PairwiseSums:
+    """成对完整观测的平移和、平方和与交叉积矩阵，可相加合并，用于求相关系数"""
+
+    def __init__(self, shift):
+        n_cols = len(shift)
+        self.shift = np.asarray(shift, dtype=np.float64)
+        self.n = np.zeros((n_cols, n_cols))
+        self.sx = np.zeros((n_cols, n_cols))
+        self.sxx = np.zeros((n_cols, n_cols))
+        self.sxy = np.zeros((n_cols, n_cols))
+
+    @classmethod
+    def from_values(cls, values):
+        with np.errstate(invalid='ignore'):
+            shift = np.nan_to_num(np.nanmean(values, axis=0)) if len(values) else np.zeros(values.shape[1])
+        sums = cls(shift)
+        valid = ~np.isnan(values)
+        centered = np.where(valid, values - shift, 0.0)
+        mask = valid.astype(np.float64)
+        sums.n = mask.T @ mask
+        sums.sx = centered.T @ mask
+        sums.sxx = (centered ** 2).T @ mask
+        sums.sxy = centered.T @ centered
+        return sums
+
+    def grow(self, new_shift):
+        n_new = len(new_shift)
+        self.shift = np.concatenate([self.shift, new_shift])
+        for name in ('n', 'sx', 'sxx', 'sxy'):
+            setattr(self, name, np.pad(getattr(self, name), ((0, n_new), (0, n_new))))
+
+    def merge(self, other, index):
+        """将other平移到本结构的平移量后，累加到index指定的列对上"""
+        d = other.shift - self.shift[index]
+        d_row, d_col = d[:, None], d[None, :]
+        sx = other.sx + d_row * other.n
+        sxx = other.sxx + 2 * d_row * other.sx + d_row ** 2 * other.n
+        sxy = other.sxy + d_row * other.sx.T + d_col * other.sx + d_row * d_col * other.n
+        block = np.ix_(index, index)
+        self.n[block] += other.n
+        self.sx[block] += sx
+        self.sxx[block] += sxx
+        self.sxy[block] += sxy
+
+    def correlation(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            covariance = self.sxy - self.sx * self.sx.T / self.n
+            variance = self.sxx - self.sx ** 2 / self.n
+            correlation = np.clip(covariance / np.sqrt(variance * variance.T), -1.0, 1.0)
+        correlation[(self.n < 1) | (variance <= 0) | (variance.T <= 0)] = np.nan
+        diagonal = np.diag_indices(len(self.shift))
+        correlation[diagonal] = np.where(np.isnan(correlation[diagonal]), np.nan, 1.0)
+        return correlation
+
+
+class KLLSketch:
+    """KLL分位数草图：层级压缩器，可合并；未发生压缩时给出精确分位数"""
+
+    def __init__(self, k=INCREMENTAL_SKETCH_K, seed=None):
+        self.k = k
+        self.n = 0
+        self.compactors = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.compactors[0] = np.concatenate([self.compactors[0], values])
+        self._compress()
+
+    def merge(self, other):
+        self.n += other.n
+        for level, items in enumerate(other.compactors):
+            if level == len(self.compactors):
+                self.compactors.append(np.empty(0))
+            self.compactors[level] = np.concatenate([self.compactors[level], items])
+        self._compress()
+
+    def _capacity(self, level):
+        depth = len(self.compactors)
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (depth - level - 1))))
+
+    def _compress(self):
+        level = 0
+        while level < len(self.compactors):
+            items = self.compactors[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append(np.empty(0))
+                items = np.sort(items)
+                # 偶数个元素参与压缩，随机保留奇数位或偶数位并提升到上一层（权重翻倍）
+                keep = items[len(items) - len(items) % 2:]
+                promoted = items[:len(items) - len(items) % 2][self._rng.integers(2)::2]
+                self.compactors[level] = keep
+                self.compactors[level + 1] = np.concatenate([self.compactors[level + 1], promoted])
+                # 上层容量随层数变化，从头重新检查
+                level = 0
+                continue
+            level += 1
+
+    def _weighted_items(self):
+        items = np.concatenate(self.compactors)
+        weights = np.concatenate([np.full(len(c), 2.0 ** level) for level, c in enumerate(self.compactors)])
+        order = np.argsort(items, kind='stable')
+        return items[order], weights[order]
+
+    @property
+    def is_exact(self):
+        return len(self.compactors) == 1
+
+    def quantiles(self, qs):
+        if self.n == 0:
+            return np.full(len(qs), np.nan)
+        if self.is_exact:
+            return np.quantile(self.compactors[0], qs)
+        items, weights = self._weighted_items()
+        cumulative = np.cumsum(weights)
+        targets = np.asarray(qs) * cumulative[-1]
+        return items[np.minimum(np.searchsorted(cumulative, targets, side='left'), len(items) - 1)]
+
+    def count_outside(self, lower, upper):
+        """估计小于lower或大于upper的值的数量"""
+        if self.n == 0:
+            return 0
+        if self.is_exact:
+            items = self.compactors[0]
+            return int(((items < lower) | (items > upper)).sum())
+        items, weights = self._weighted_items()
+        outside = weights[(items < lower) | (items > upper)].sum()
+        return int(round(outside * self.n / weights.sum()))
+
+
+class IncrementalAnalyzer:
+    """可持久化的增量分析状态：新增数据只需按增量大小的时间合并"""
+    DIAGNOSIS_COLUMN = '病理诊断（病案首页）'
+
+    def __init__(self):
+        self.total_rows = 0
+        self.numeric_columns = []
+        self.moments = RunningMoments()
+        self.pairwise = PairwiseSums(np.zeros(0))
+        self.sketches = {}
+        self.text_stats = {}
+        self.diagnosis_counts = Counter()
+        self.diagnosis_words = Counter()
+        self.temporal = {}
+
+    @classmethod
+    def from_data(cls, json1, json2):
+        """由一批数据构建汇总状态"""
+        state = cls()
+        numeric_df = to_frame(json1).select_dtypes(include=[np.number])
+        text_df = to_frame(json2)
+        values = np.ascontiguousarray(numeric_df.to_numpy(dtype=np.float64, na_value=np.nan))
+
+        state.total_rows = max(len(numeric_df), len(text_df))
+        state.numeric_columns = list(numeric_df.columns)
+        state.moments = RunningMoments.from_values(values)
+        state.pairwise = PairwiseSums.from_values(values)
+        for i, column in enumerate(state.numeric_columns):
+            sketch = KLLSketch()
+            sketch.update(values[:, i])
+            state.sketches[column] = sketch
+
+        for column in text_df.columns:
+            series = text_df[column].dropna()
+            lengths = series.str.len().dropna()
+            state.text_stats[column] = {
+                'counts': Counter(value_counts(series).to_dict()),
+                'length_sum': float(lengths.sum()),
+                'length_count': int(len(lengths)),
+                'min_length': float(lengths.min()) if len(lengths) else np.nan,
+                'max_length': float(lengths.max()) if len(lengths) else np.nan
+            }
+
+        if cls.DIAGNOSIS_COLUMN in text_df.columns:
+            diagnosis = text_df[cls.DIAGNOSIS_COLUMN]
+            state.diagnosis_counts = Counter(value_counts(diagnosis).to_dict())
+            term_index = get_term_index(json2, cls.DIAGNOSIS_COLUMN)
+            state.diagnosis_words = Counter(term_index.term_frequencies().to_dict())
+        
+        state.temporal = {column: index.aggregate('D') for column, index in get_time_indexes(json1, json2).items()}
+        return state
+
+    def merge(self, other):
+        """合并另一份汇总状态（列按名称对齐，新列追加在末尾）"""
+        new_columns = [c for c in other.numeric_columns if c not in self.numeric_columns]
+        if new_columns:
+            positions = [other.numeric_columns.index(c) for c in new_columns]
+            self.moments.grow(len(new_columns))
+            self.pairwise.grow(other.pairwise.shift[positions])
+            self.numeric_columns.extend(new_columns)
+        index = np.array([self.numeric_columns.index(c) for c in other.numeric_columns], dtype=np.intp)
+        self.moments.merge(other.moments, index)
+        self.pairwise.merge(other.pairwise, index)
+        for column, sketch in other.sketches.items():
+            if column in self.sketches:
+                self.sketches[column].merge(sketch)
+            else:
+                self.sketches[column] = sketch
+
+        for column, stats in other.text_stats.items():
+            current = self.text_stats.setdefault(column, {
+                'counts': Counter(), 'length_sum': 0.0, 'length_count': 0,
+                'min_length': np.nan, 'max_length': np.nan
+            })
+            current['counts'].update(stats['counts'])
+            current['length_sum'] += stats['length_sum']
+            current['length_count'] += stats['length_count']
+            current['min_length'] = float(np.fmin(current['min_length'], stats['min_length']))
+            current['max_length'] = float(np.fmax(current['max_length'], stats['max_length']))
+
+        self.diagnosis_counts.update(other.diagnosis_counts)
+        self.diagnosis_words.update(other.diagnosis_words)
+        for column, daily in other.temporal.items():
+            self.temporal[column] = self.temporal[column].merge(daily) if column in self.temporal else daily
+        self.total_rows += other.total_rows
+        return self
+
+    def update(self, json1, json2):
+        """将增量数据合并进当前状态"""
+        return self.merge(IncrementalAnalyzer.from_data(json1, json2))
+
+    def results(self):
+        """生成与DataAnalyzer.analyze_data结构一致的分析结果"""
+        columns = self.numeric_columns
+        std = self.moments.std()
+        basic_stats = {}
+        outliers = {}
+        for i, column in enumerate(columns):
+            q1, median, q3 = self.sketches[column].quantiles([0.25, 0.5, 0.75])
+            count = self.moments.count[i]
+            basic_stats[column] = {
+                'count': float(count),
+                'mean': float(self.moments.mean[i]) if count else np.nan,
+                'std': float(std[i]),
+                'min': float(self.moments.min[i]),
+                '25%': float(q1),
+                '50%': float(median),
+                '75%': float(q3),
+                'max': float(self.moments.max[i])
+            }
+            iqr = q3 - q1
+            outlier_count = self.sketches[column].count_outside(q1 - 1.5 * iqr, q3 + 1.5 * iqr)
+            outliers[column] = {
+                'count': outlier_count,
+                'percentage': outlier_count / self.total_rows * 100 if self.total_rows else 0.0
+            }
+        correlation_matrix = self.pairwise.correlation()
+        correlation = {
+            column: {other: float(correlation_matrix[j, i]) for j, other in enumerate(columns)}
+            for i, column in enumerate(columns)
+        }
+
+        text_lengths = {}
+        unique_values = {}
+        for column, stats in self.text_stats.items():
+            text_lengths[column] = {
+                'mean_length': stats['length_sum'] / stats['length_count'] if stats['length_count'] else np.nan,
+                'max_length': stats['max_length'],
+                'min_length': stats['min_length']
+            }
+            unique_values[column] = {
+                'count': len(stats['counts']),
+                'top_values': dict(stats['counts'].most_common(5))
+            }
+
+        temporal_trends = {column: summarize_trend(daily) for column, daily in self.temporal.items()}
+
+        return {
+            'numeric_analysis': {
+                'basic_stats': basic_stats,
+                'outliers': outliers,
+                'correlation': correlation
+            },
+            'text_analysis': {
+                'text_lengths': text_lengths,
+                'unique_values': unique_values
+            },
+            'diagnosis_analysis': {
+                'diagnosis_freq': dict(self.diagnosis_counts.most_common(10)),
+                'diagnosis_words': dict(self.diagnosis_words.most_common(20))
+            },
+            'temporal_analysis': temporal_trends
+        }
+
+    @classmethod
+    def load(cls, path):
+        """读取持久化状态，文件不存在时返回空状态"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, path):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
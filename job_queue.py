@@ -0,0 +1,270 @@
+"""后台任务队列：上传文件在工作进程池中逐阶段处理，任务状态、进度和部分结果保存在SQLite任务表中
+
+页面只负责提交任务和轮询进度，处理过程不占用Streamlit脚本线程；任务表和结果文件保存在磁盘上，
+刷新页面后可按任务ID恢复，服务重启时未完成的任务会重新提交。
+"""
+
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from data_processor import DataProcessor
+from data_analyzer import DataAnalyzer
+from data_visualization import DataVisualizer
+from retrieval import RetrievalIndex
+from patient_index import get_patient_index
+from profiling import span, get_profiler
+from config import JOB_DB_PATH, JOB_DATA_DIR, JOB_MAX_WORKERS, JOB_RETENTION_SECONDS
+
+# 处理阶段及显示名称（按执行顺序）
+STAGES = [
+    ('process', '数据处理'),
+    ('analysis', '数据分析'),
+    ('visualizations', '创建可视化'),
+    ('indexes', '构建检索索引')
+]
+STAGE_LABELS = dict(STAGES)
+# 未结束的任务状态
+PENDING_STATUSES = ('queued', 'running')
+
+
+def _connect(db_path):
+    """打开任务表连接（各进程各自连接，WAL模式下读写互不阻塞）"""
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            job_id TEXT PRIMARY KEY,
+            dataset_key TEXT NOT NULL,
+            file_name TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            result_path TEXT NOT NULL,
+            status TEXT NOT NULL,
+            stage TEXT,
+            completed INTEGER NOT NULL DEFAULT 0,
+            partial BLOB,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_dataset ON jobs (dataset_key)')
+    conn.commit()
+    return conn
+
+
+def _update(conn, job_id, **fields):
+    """更新任务字段并刷新更新时间"""
+    fields['updated_at'] = time.time()
+    assignments = ', '.join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE jobs SET {assignments} WHERE job_id = ?", (*fields.values(), job_id))
+    conn.commit()
+
+
+def _run_job(db_path, job_id, file_path, result_path):
+    """在工作进程中执行任务：每完成一个阶段更新进度并保存可先行展示的部分结果，最后写出完整结果
+
+    返回本任务调用链的剖析区间，由页面进程并入其剖析器（工作进程内的记录随进程退出丢失）。
+    """
+    conn = _connect(db_path)
+    job_span = span('job', job_id=job_id)
+    partial = {}
+
+    def advance(stage, **results):
+        # 部分结果累积保存，页面按已完成的阶段展示
+        partial.update(results)
+        _update(conn, job_id, completed=[name for name, _ in STAGES].index(stage) + 1,
+                partial=pickle.dumps(partial, protocol=pickle.HIGHEST_PROTOCOL))
+
+    try:
+        with job_span:
+            _update(conn, job_id, status='running', stage='process')
+            with span('job_stage', stage='process'):
+                processed_data = DataProcessor().process_data(file_path)
+            # 概览只需首条记录，不随部分结果传输整个数据集
+            advance('process', processed_data={
+                'json1': processed_data['json1'][:1].to_list(),
+                'json2': processed_data['json2'][:1].to_list()
+            })
+
+            _update(conn, job_id, stage='analysis')
+            with span('job_stage', stage='analysis'):
+                analysis_results = DataAnalyzer().analyze_data(processed_data['json1'], processed_data['json2'])
+            advance('analysis', analysis_results=analysis_results)
+
+            _update(conn, job_id, stage='visualizations')
+            with span('job_stage', stage='visualizations'):
+                visualizations = DataVisualizer().create_all_visualizations(
+                    processed_data['json1'], processed_data['json2']
+                )
+            advance('visualizations')
+
+            _update(conn, job_id, stage='indexes')
+            with span('job_stage', stage='indexes'):
+                retrieval_index = RetrievalIndex(processed_data['json2'])
+                patient_index = get_patient_index(processed_data['json1'], processed_data['json2'])
+
+            # 各部分共享同一份数据，整体序列化一次
+            dataset = {
+                'processed_data': processed_data,
+                'analysis_results': analysis_results,
+                'visualizations': visualizations,
+                'retrieval_index': retrieval_index,
+                'patient_index': patient_index
+            }
+            tmp_path = f"{result_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(dataset, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, result_path)
+            # 部分结果只用于处理中的展示，完成后清除
+            _update(conn, job_id, status='done', stage=None, completed=len(STAGES), partial=None)
+    except Exception as e:
+        _update(conn, job_id, status='failed', error=str(e), partial=None)
+    finally:
+        conn.close()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+    profiler = get_profiler()
+    return profiler.trace_records(job_span.trace_id) if profiler.enabled else []
+
+
+class JobQueue:
+    """上传处理任务队列：任务表 + 工作进程池，同一数据集未结束或结果仍保留的任务只执行一次"""
+
+    def __init__(self, db_path=JOB_DB_PATH, data_dir=JOB_DATA_DIR, max_workers=JOB_MAX_WORKERS,
+                 retention_seconds=JOB_RETENTION_SECONDS):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        self.retention_seconds = retention_seconds
+        self.max_workers = max_workers
+        os.makedirs(data_dir, exist_ok=True)
+        self._conn = _connect(db_path)
+        self._lock = threading.Lock()
+        self._executor = self._new_executor()
+        self._purge()
+        self._recover()
+
+    def submit(self, dataset_key, file_name, data):
+        """提交上传文件的处理任务并返回任务ID；同一数据集已有未结束或结果仍可用的任务时直接返回该任务"""
+        self._purge()
+        with self._lock:
+            for row in self._conn.execute(
+                    'SELECT job_id, status, result_path FROM jobs WHERE dataset_key = ? ORDER BY created_at DESC',
+                    (dataset_key,)).fetchall():
+                if row['status'] in PENDING_STATUSES or (row['status'] == 'done' and os.path.exists(row['result_path'])):
+                    return row['job_id']
+
+            job_id = uuid.uuid4().hex
+            file_path = os.path.join(self.data_dir, f"{job_id}{os.path.splitext(file_name)[1]}")
+            result_path = os.path.join(self.data_dir, f"{job_id}.pkl")
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            now = time.time()
+            self._conn.execute(
+                'INSERT INTO jobs (job_id, dataset_key, file_name, file_path, result_path, status, created_at, updated_at) '
+                "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?)",
+                (job_id, dataset_key, file_name, file_path, result_path, now, now)
+            )
+            self._conn.commit()
+        self._start(job_id, file_path, result_path)
+        return job_id
+
+    def get(self, job_id):
+        """读取任务状态：状态、当前阶段、已完成阶段数、错误信息及部分结果（仅未结束的任务），任务不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT * FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        pending = job['status'] in PENDING_STATUSES and job['partial']
+        job['partial'] = pickle.loads(job['partial']) if pending else {}
+        job['progress'] = job['completed'] / len(STAGES)
+        return job
+
+    def load_result(self, job_id):
+        """读取已完成任务的完整结果"""
+        job = self.get(job_id)
+        if job is None or job['status'] != 'done':
+            raise Exception(f"任务{job_id}尚未完成")
+        try:
+            with open(job['result_path'], 'rb') as f:
+                return pickle.load(f)
+        except Exception as e:
+            raise Exception(f"读取任务结果失败: {str(e)}")
+
+    def result_size(self, job_id):
+        """已完成任务结果文件的字节数，结果不存在时返回None"""
+        with self._lock:
+            row = self._conn.execute('SELECT result_path FROM jobs WHERE job_id = ?', (job_id,)).fetchone()
+        if row is None or not os.path.exists(row['result_path']):
+            return None
+        return os.path.getsize(row['result_path'])
+
+    def _new_executor(self):
+        # 以spawn方式启动工作进程，避免复制页面进程中的线程和锁状态
+        return ProcessPoolExecutor(max_workers=self.max_workers, mp_context=multiprocessing.get_context('spawn'))
+
+    def _start(self, job_id, file_path, result_path):
+        """将任务交给工作进程；工作进程异常退出时将任务标记为失败"""
+        executor = self._executor
+        try:
+            future = executor.submit(_run_job, self.db_path, job_id, file_path, result_path)
+        except BrokenProcessPool:
+            # 工作进程异常退出（如内存不足被终止）后进程池不再可用，重建后重新提交
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = self._new_executor()
+                executor = self._executor
+            try:
+                future = executor.submit(_run_job, self.db_path, job_id, file_path, result_path)
+            except Exception as e:
+                with self._lock:
+                    _update(self._conn, job_id, status='failed', error=f"提交任务失败: {str(e)}")
+                return
+
+        def on_done(future):
+            if future.exception() is not None:
+                with self._lock:
+                    _update(self._conn, job_id, status='failed', error=f"工作进程异常退出: {future.exception()}")
+            else:
+                # 工作进程中各阶段的剖析区间并入页面进程，在剖析面板和Prometheus指标中可见
+                get_profiler().merge(future.result())
+
+        future.add_done_callback(on_done)
+
+    def _recover(self):
+        """服务重启后重新提交上次未结束的任务，上传文件已丢失的任务标记为失败"""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id, file_path, result_path FROM jobs WHERE status IN {PENDING_STATUSES}"
+            ).fetchall()
+            for row in rows:
+                if os.path.exists(row['file_path']):
+                    _update(self._conn, row['job_id'], status='queued', stage=None, completed=0, partial=None)
+                else:
+                    _update(self._conn, row['job_id'], status='failed', error='上传文件已丢失，请重新上传')
+        for row in rows:
+            if os.path.exists(row['file_path']):
+                self._start(row['job_id'], row['file_path'], row['result_path'])
+
+    def _purge(self):
+        """删除超过保留时长的已结束任务及其结果文件"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT job_id, file_path, result_path FROM jobs WHERE status NOT IN {PENDING_STATUSES} AND updated_at < ?",
+                (cutoff,)
+            ).fetchall()
+            for row in rows:
+                for path in (row['file_path'], row['result_path']):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._conn.execute('DELETE FROM jobs WHERE job_id = ?', (row['job_id'],))
+            self._conn.commit()
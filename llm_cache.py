@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from config import LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_MB
+
+
+class LLMResponseCache:
+    """基于SQLite的模型响应缓存：按模型、规范化提示词和参数哈希，支持TTL与按字节LRU淘汰"""
+    # 回放缓存的流式响应时每段的字符数
+    REPLAY_CHUNK_CHARS = 16
+
+    def __init__(self, db_path, ttl_seconds, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(payload):
+        """根据请求体计算缓存键：模型 + 规范化后的消息 + 其余参数（流式与否不影响结果）"""
+        messages = [
+            {'role': message['role'], 'content': re.sub(r'\s+', ' ', message['content']).strip()}
+            for message in payload.get('messages', [])
+        ]
+        params = {k: v for k, v in payload.items() if k not in ('model', 'messages', 'stream')}
+        raw = json.dumps({'model': payload.get('model'), 'messages': messages, 'params': params},
+                         ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """读取未过期的缓存响应，未命中返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT response, created_at FROM responses WHERE key = ?', (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """写入响应，并按最近访问时间淘汰到容量上限以内"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO responses (key, response, size, created_at, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (key, response, size, now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        # 先清理过期条目，再按LRU淘汰
+        self._conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute(
+                'SELECT key, size FROM responses ORDER BY accessed_at ASC').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+
+    def replay(self, response):
+        """将缓存的完整响应按小段回放，模拟流式输出"""
+        for start in range(0, len(response), self.REPLAY_CHUNK_CHARS):
+            yield response[start:start + self.REPLAY_CHUNK_CHARS]
+
+    def stats(self):
+        """返回命中/未命中次数与当前容量"""
+        with self._lock:
+            entries, total = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses'
+            ).fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'entries': entries, 'bytes': total}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    """获取进程内共享的响应缓存，未配置缓存路径时返回None"""
+    global _cache
+    if not LLM_CACHE_PATH:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = LLMResponseCache(LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_MB * 1024 * 1024)
+    return _cache
@@ -0,0 +1,126 @@
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockCompletionServer:
+    """本地模拟的DeepSeek对话补全接口，用于联调和性能测试"""
+
+    def __init__(self, host='127.0.0.1', port=0, reply='这是模拟的回答。',
+                 latency=0.0, chunk_delay=0.0, fail_first=0, fail_status=503):
+        self.reply = reply
+        self.latency = latency
+        self.chunk_delay = chunk_delay
+        self.fail_status = fail_status
+        self.request_count = 0
+        self._remaining_failures = fail_first
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/chat/completions"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _next_response_fails(self):
+        """按配置让前若干个请求失败，用于验证重试逻辑"""
+        with self._lock:
+            self.request_count += 1
+            if self._remaining_failures > 0:
+                self._remaining_failures -= 1
+                return True
+            return False
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                payload = json.loads(self.rfile.read(length) or b'{}')
+
+                if server._next_response_fails():
+                    self._send_json({'error': 'mock failure'}, status=server.fail_status)
+                    return
+
+                time.sleep(server.latency)
+                if payload.get('stream'):
+                    self._send_stream(payload)
+                else:
+                    self._send_json({
+                        'model': payload.get('model'),
+                        'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': server.reply}}]
+                    })
+
+            def _send_json(self, body, status=200):
+                data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_stream(self, payload):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                for char in server.reply:
+                    event = {
+                        'model': payload.get('model'),
+                        'choices': [{'index': 0, 'delta': {'content': char}}]
+                    }
+                    self.wfile.write(f"data: {json.dumps(event, ensure_ascii=False)}\n\n".encode('utf-8'))
+                    self.wfile.flush()
+                    time.sleep(server.chunk_delay)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+                self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟DeepSeek接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的响应延迟（秒）')
+    parser.add_argument('--chunk-delay', type=float, default=0.0, help='流式输出每个片段的间隔（秒）')
+    parser.add_argument('--fail-first', type=int, default=0, help='前N个请求返回错误')
+    args = parser.parse_args()
+
+    server = MockCompletionServer(args.host, args.port, latency=args.latency,
+                                  chunk_delay=args.chunk_delay, fail_first=args.fail_first)
+    print(f"模拟接口已启动: {server.url}（设置 DEEPSEEK_API_URL 指向该地址）")
+    server.start()
+    try:
+        server._thread.join()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
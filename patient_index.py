@@ -0,0 +1,85 @@
+"""患者分组索引：按假名化患者标识将记录分组，组内按日期排序，按患者提取时间线只需访问该患者的记录"""
+
+import re
+import numpy as np
+import pandas as pd
+from data_processor import DataProcessor, RecordView, to_frame
+from temporal import get_time_indexes
+
+PATIENT_KEY_COLUMN = DataProcessor.PATIENT_KEY_COLUMN
+# 组内排序优先使用的日期列，都不存在时使用识别出的第一个日期列
+TIMELINE_DATE_COLUMNS = ('报告日期', '就诊日期', '入院日期')
+# 文本中的患者标识（前后不能紧邻其他十六进制字符）
+PATIENT_KEY_PATTERN = re.compile(rf'(?<![0-9a-f])[0-9a-f]{{{DataProcessor.PATIENT_KEY_LENGTH}}}(?![0-9a-f])')
+
+
+class PatientIndex:
+    """患者 → 行号的分组索引（CSR结构）：各患者的行号按日期排序后连续存放，无日期的记录排在组末"""
+
+    def __init__(self, json1, json2, column=PATIENT_KEY_COLUMN):
+        self.json1 = json1
+        self.json2 = json2
+        keys = to_frame(json2)[column]
+        if not isinstance(keys.dtype, pd.CategoricalDtype):
+            keys = keys.astype('category')
+        codes = keys.cat.codes.to_numpy()
+        self.keys = keys.cat.categories
+
+        # 先按日期排序（复用时间索引中已排好的行号），再按患者稳定排序，组内即为时间顺序
+        time_indexes = get_time_indexes(json1, json2)
+        self.date_column = next((c for c in TIMELINE_DATE_COLUMNS if c in time_indexes), next(iter(time_indexes), None))
+        if self.date_column is not None:
+            dated_rows = time_indexes[self.date_column].rows
+            undated = np.ones(len(codes), dtype=bool)
+            undated[dated_rows] = False
+            order = np.concatenate([dated_rows, np.flatnonzero(undated)])
+        else:
+            order = np.arange(len(codes))
+        order = order[codes[order] >= 0]
+        ordered_codes = codes[order]
+        self.rows = order[np.argsort(ordered_codes, kind='stable')]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(ordered_codes, minlength=len(self.keys)))])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+    def rows_for(self, key):
+        """该患者按日期排序的行号"""
+        position = self.keys.get_loc(key)
+        return self.rows[self.offsets[position]:self.offsets[position + 1]]
+
+    def sizes(self):
+        """每位患者的记录数"""
+        return pd.Series(np.diff(self.offsets), index=self.keys)
+
+    def timeline(self, key):
+        """该患者按日期排序的记录（数值与文本字段合并，去除空值）"""
+        rows = self.rows_for(key)
+        numeric_records = RecordView._build_records(to_frame(self.json1).iloc[rows])
+        text_records = RecordView._build_records(to_frame(self.json2).iloc[rows])
+        return [{**text_record, **numeric_record} for numeric_record, text_record in zip(numeric_records, text_records)]
+
+    def timelines(self):
+        """依次产出（患者标识, 时间线），可直接传给 BatchReportEngine.run"""
+        for position, key in enumerate(self.keys):
+            if self.offsets[position + 1] > self.offsets[position]:
+                yield key, self.timeline(key)
+
+    def find_key(self, text):
+        """返回文本中提到的第一个已知患者标识，没有时返回None"""
+        for match in PATIENT_KEY_PATTERN.findall(text):
+            if match in self.keys:
+                return match
+        return None
+
+
+def get_patient_index(json1, json2):
+    """获取数据集的患者分组索引，没有患者标识列时返回None；记录视图上缓存，同一数据集只构建一次"""
+    if PATIENT_KEY_COLUMN not in to_frame(json2).columns:
+        return None
+    if isinstance(json2, RecordView):
+        return json2.cached('patient_index', lambda frame: PatientIndex(json1, json2))
+    return PatientIndex(json1, json2)
@@ -0,0 +1,41 @@
+"""绘图数据的服务端聚合：直方图预分箱和箱线图统计量，使图表数据量与行数无关"""
+
+import numpy as np
+
+
+def _finite(values):
+    values = np.asarray(values, dtype=np.float64)
+    return values[np.isfinite(values)]
+
+
+def histogram_bins(values, max_bins):
+    """预先计算直方图分箱，返回（箱中心，箱宽，计数）"""
+    values = _finite(values)
+    if len(values) == 0:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    bins = max(1, min(max_bins, int(np.ceil(np.sqrt(len(values))))))
+    counts, edges = np.histogram(values, bins=bins)
+    return (edges[:-1] + edges[1:]) / 2, np.diff(edges), counts
+
+
+def box_statistics(values, max_outliers):
+    """计算箱线图统计量（四分位数、须线位置、均值）及抽样后的异常点"""
+    values = np.sort(_finite(values))
+    if len(values) == 0:
+        return None
+    q1, median, q3 = np.quantile(values, [0.25, 0.5, 0.75])
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    outliers = values[(values < q1 - 1.5 * iqr) | (values > q3 + 1.5 * iqr)]
+    if len(outliers) > max_outliers:
+        # 均匀抽样（保留两端极值）
+        outliers = outliers[np.linspace(0, len(outliers) - 1, max_outliers).astype(np.intp)]
+    return {
+        'q1': q1,
+        'median': median,
+        'q3': q3,
+        'lowerfence': inside[0] if len(inside) else q1,
+        'upperfence': inside[-1] if len(inside) else q3,
+        'mean': values.mean(),
+        'outliers': outliers
+    }
@@ -0,0 +1,318 @@
+"""轻量级性能剖析：按阶段记录墙钟时间、CPU时间、峰值内存增量、数据规模及大模型首字延迟与生成速度
+
+未启用时 span() 返回共享的空操作对象，被插桩的代码只多一次属性判断。
+"""
+
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from collections import deque, defaultdict
+from functools import wraps
+from config import PROFILING_ENABLED, PROFILING_EXPORT_PATH, PROFILING_MAX_SPANS
+
+try:
+    import resource
+except ImportError:  # Windows没有resource模块，不记录内存
+    resource = None
+
+
+def _peak_rss_bytes():
+    """进程峰值常驻内存（字节）"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux以KB为单位，macOS以字节为单位
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Span:
+    """一次计时区间；可通过 set() 补充行数、列数等属性，通过 record_*() 记录模型输入输出的token数"""
+
+    def __init__(self, profiler, name, parent=None, token_counter=None, **attrs):
+        self.profiler = profiler
+        self.name = name
+        self.span_id = next(profiler._ids)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.trace_id = parent.trace_id if parent is not None else self.span_id
+        self.depth = parent.depth + 1 if parent is not None else 0
+        self.attrs = attrs
+        self.token_counter = token_counter
+        self.output_tokens = 0
+        self.first_chunk_at = None
+
+    def set(self, **attrs):
+        """补充属性（如 rows、columns、cache_hit）"""
+        self.attrs.update(attrs)
+
+    def record_prompt(self, text):
+        """记录提示词的token数"""
+        if self.token_counter is not None:
+            self.attrs['prompt_tokens'] = self.token_counter(text)
+
+    def record_chunk(self, text):
+        """记录一段流式输出：首段到达时间及输出token数"""
+        if self.first_chunk_at is None:
+            self.first_chunk_at = time.perf_counter()
+        if self.token_counter is not None:
+            self.output_tokens += self.token_counter(text)
+
+    def record_output(self, text):
+        """记录非流式调用的完整输出"""
+        if self.token_counter is not None:
+            self.output_tokens += self.token_counter(text)
+
+    def __enter__(self):
+        self.thread = threading.current_thread().name
+        self.started_at = time.time()
+        self.rss_start = _peak_rss_bytes()
+        self.cpu_start = time.thread_time()
+        self.wall_start = time.perf_counter()
+        self.profiler._push(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        wall_end = time.perf_counter()
+        self.wall_seconds = wall_end - self.wall_start
+        self.cpu_seconds = time.thread_time() - self.cpu_start
+        rss_end = _peak_rss_bytes()
+        self.peak_rss_delta = rss_end - self.rss_start if rss_end is not None else None
+        if exc_type is not None:
+            self.attrs['error'] = str(exc)
+        if self.first_chunk_at is not None:
+            # 流式调用：首字延迟，以及首字之后的生成速度
+            self.attrs['time_to_first_token'] = self.first_chunk_at - self.wall_start
+            self.attrs['output_tokens'] = self.output_tokens
+            generation_seconds = wall_end - self.first_chunk_at
+            if generation_seconds > 0:
+                self.attrs['tokens_per_second'] = self.output_tokens / generation_seconds
+        elif self.output_tokens:
+            # 非流式调用：按整个请求的耗时计算
+            self.attrs['output_tokens'] = self.output_tokens
+            self.attrs['tokens_per_second'] = self.output_tokens / self.wall_seconds
+        self.profiler._pop(self)
+        return False
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'trace_id': self.trace_id,
+            'depth': self.depth,
+            'thread': self.thread,
+            'started_at': self.started_at,
+            'wall_seconds': self.wall_seconds,
+            'cpu_seconds': self.cpu_seconds,
+            'peak_rss_delta': self.peak_rss_delta,
+            **self.attrs
+        }
+
+
+class _NullSpan:
+    """未启用剖析时使用的空操作区间"""
+
+    def set(self, **attrs):
+        pass
+
+    def record_prompt(self, text):
+        pass
+
+    def record_chunk(self, text):
+        pass
+
+    def record_output(self, text):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Profiler:
+    """收集已完成的区间（保留最近若干条），可选逐条追加到JSON Lines文件"""
+
+    def __init__(self, enabled=False, export_path=None, max_spans=1000):
+        self.enabled = enabled
+        self.export_path = export_path
+        self.spans = deque(maxlen=max_spans)
+        self._ids = itertools.count(1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def span(self, name, parent=None, token_counter=None, **attrs):
+        """创建计时区间；未指定parent时嵌套在当前线程正在进行的区间之下"""
+        if not self.enabled:
+            return NULL_SPAN
+        if parent is None:
+            parent = self.current()
+        elif parent is NULL_SPAN:
+            parent = None
+        return Span(self, name, parent, token_counter, **attrs)
+
+    def current(self):
+        """当前线程正在进行的最内层区间（跨线程时需显式传入parent）"""
+        stack = getattr(self._local, 'stack', None)
+        return stack[-1] if stack else None
+
+    def _push(self, span):
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        self._local.stack.append(span)
+
+    def _pop(self, span):
+        self._local.stack.remove(span)
+        record = span.to_dict()
+        with self._lock:
+            self.spans.append(record)
+            if self.export_path:
+                with open(self.export_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def trace_records(self, trace_id):
+        """某条调用链中已完成的区间"""
+        with self._lock:
+            return [record for record in self.spans if record['trace_id'] == trace_id]
+
+    def merge(self, records):
+        """并入其他进程（如后台任务的工作进程）记录的区间，重新分配区间编号以免与本进程冲突
+
+        工作进程已自行追加到导出文件，这里只加入内存中的记录，供剖析面板和Prometheus指标使用。
+        """
+        if not self.enabled or not records:
+            return
+        ids = {record['span_id']: next(self._ids) for record in records}
+        with self._lock:
+            for record in sorted(records, key=lambda record: record['started_at']):
+                self.spans.append({
+                    **record,
+                    'span_id': ids[record['span_id']],
+                    'parent_id': ids.get(record['parent_id']),
+                    'trace_id': ids.get(record['trace_id'], ids[record['span_id']])
+                })
+
+    def traces(self):
+        """按调用链分组的已完成区间（最新的调用链在前）"""
+        with self._lock:
+            records = list(self.spans)
+        grouped = defaultdict(list)
+        for record in records:
+            grouped[record['trace_id']].append(record)
+        return [sorted(grouped[trace_id], key=lambda record: record['started_at'])
+                for trace_id in sorted(grouped, reverse=True)]
+
+    def export_prometheus(self, path):
+        """写出Prometheus文本文件（可供node_exporter的textfile收集器读取）"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    def export_jsonl(self, path):
+        """将已收集的区间写入JSON Lines文件"""
+        with self._lock:
+            records = list(self.spans)
+        with open(path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+    def prometheus_text(self):
+        """按区间名称汇总为Prometheus文本格式"""
+        with self._lock:
+            records = list(self.spans)
+        stages = defaultdict(lambda: {'count': 0, 'wall': 0.0, 'cpu': 0.0, 'rss': 0})
+        llm = defaultdict(lambda: {'count': 0, 'ttft': 0.0, 'tps_count': 0, 'tps': 0.0})
+        for record in records:
+            stage = stages[record['name']]
+            stage['count'] += 1
+            stage['wall'] += record['wall_seconds']
+            stage['cpu'] += record['cpu_seconds']
+            stage['rss'] = max(stage['rss'], record['peak_rss_delta'] or 0)
+            if 'time_to_first_token' in record:
+                call = llm[record['name']]
+                call['count'] += 1
+                call['ttft'] += record['time_to_first_token']
+                if 'tokens_per_second' in record:
+                    call['tps_count'] += 1
+                    call['tps'] += record['tokens_per_second']
+
+        lines = [
+            '# HELP medical_app_stage_wall_seconds Wall clock time spent in each stage.',
+            '# TYPE medical_app_stage_wall_seconds summary',
+        ]
+        for name, stage in stages.items():
+            lines.append(f'medical_app_stage_wall_seconds_sum{{stage="{name}"}} {stage["wall"]:.6f}')
+            lines.append(f'medical_app_stage_wall_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines += [
+            '# HELP medical_app_stage_cpu_seconds CPU time spent in each stage (calling thread).',
+            '# TYPE medical_app_stage_cpu_seconds summary',
+        ]
+        for name, stage in stages.items():
+            lines.append(f'medical_app_stage_cpu_seconds_sum{{stage="{name}"}} {stage["cpu"]:.6f}')
+            lines.append(f'medical_app_stage_cpu_seconds_count{{stage="{name}"}} {stage["count"]}')
+        lines += [
+            '# HELP medical_app_stage_peak_rss_delta_bytes Largest peak RSS growth observed in each stage.',
+            '# TYPE medical_app_stage_peak_rss_delta_bytes gauge',
+        ]
+        for name, stage in stages.items():
+            lines.append(f'medical_app_stage_peak_rss_delta_bytes{{stage="{name}"}} {stage["rss"]}')
+        lines += [
+            '# HELP medical_app_llm_time_to_first_token_seconds Time until the first streamed chunk.',
+            '# TYPE medical_app_llm_time_to_first_token_seconds summary',
+        ]
+        for name, call in llm.items():
+            lines.append(f'medical_app_llm_time_to_first_token_seconds_sum{{call="{name}"}} {call["ttft"]:.6f}')
+            lines.append(f'medical_app_llm_time_to_first_token_seconds_count{{call="{name}"}} {call["count"]}')
+        lines += [
+            '# HELP medical_app_llm_tokens_per_second Output tokens per second after the first chunk.',
+            '# TYPE medical_app_llm_tokens_per_second summary',
+        ]
+        for name, call in llm.items():
+            lines.append(f'medical_app_llm_tokens_per_second_sum{{call="{name}"}} {call["tps"]:.6f}')
+            lines.append(f'medical_app_llm_tokens_per_second_count{{call="{name}"}} {call["tps_count"]}')
+        return '\n'.join(lines) + '\n'
+
+
+_profiler = Profiler(PROFILING_ENABLED, PROFILING_EXPORT_PATH, PROFILING_MAX_SPANS)
+
+
+def get_profiler():
+    """获取进程内共享的剖析器"""
+    return _profiler
+
+
+def current_span():
+    """当前线程正在进行的区间，没有时返回空操作区间（可直接调用 set()）"""
+    if not _profiler.enabled:
+        return NULL_SPAN
+    return _profiler.current() or NULL_SPAN
+
+
+def span(name, parent=None, token_counter=None, **attrs):
+    """在全局剖析器上创建计时区间（with span('阶段') as s: ...）"""
+    return _profiler.span(name, parent, token_counter, **attrs)
+
+
+def profiled(name=None, measure=None):
+    """函数计时装饰器；measure(result) 可返回需要记录的属性（如行数、列数）"""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _profiler.enabled:
+                return func(*args, **kwargs)
+            with _profiler.span(span_name) as current:
+                result = func(*args, **kwargs)
+                if measure is not None:
+                    current.set(**measure(result))
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import pickle
+import sys
+import threading
+from collections import Counter, OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def estimate_size(value):
+    """不序列化估算对象占用的字节数：DataFrame/数组按数据缓冲区计，容器和对象属性递归累加，共享对象只计一次"""
+    seen = set()
+    total = 0
+    stack = [value]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, pd.DataFrame):
+            total += int(obj.memory_usage(deep=True).sum())
+        elif isinstance(obj, (pd.Series, pd.Index)):
+            total += int(obj.memory_usage(deep=True))
+        elif isinstance(obj, np.ndarray):
+            total += obj.nbytes
+        elif isinstance(obj, dict):
+            total += sys.getsizeof(obj)
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            total += sys.getsizeof(obj)
+            stack.extend(obj)
+        else:
+            total += sys.getsizeof(obj)
+            if isinstance(getattr(obj, '__dict__', None), dict):
+                stack.append(obj.__dict__)
+    return total
+
+
+class ResultCache:
+    """按上传内容哈希缓存处理结果：内存LRU（按字节预算淘汰，跳过被固定的条目）+ 可选磁盘层"""
+
+    def __init__(self, max_bytes, disk_dir=None):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()  # key -> (value, size)
+        self._total_bytes = 0
+        self._pins = Counter()  # key -> 固定次数（正在被会话使用的条目不参与淘汰）
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def content_key(data):
+        """计算上传内容的哈希键"""
+        return hashlib.sha256(data).hexdigest()
+
+    def get(self, key):
+        """读取缓存，内存未命中时尝试磁盘层"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key][0]
+
+        path = self._disk_path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'rb') as f:
+                payload = f.read()
+            value = pickle.loads(payload)
+        except Exception:
+            # 损坏的磁盘缓存视为未命中
+            return None
+        self._store(key, value, len(payload))
+        return value
+
+    def put(self, key, value, size=None):
+        """写入缓存；只有配置了磁盘层时才序列化，否则使用调用方给出的大小（如结果文件字节数）或估算值"""
+        path = self._disk_path(key)
+        if path is not None:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+            size = len(payload)
+        elif size is None:
+            size = estimate_size(value)
+        self._store(key, value, size)
+
+    def __contains__(self, key):
+        with self._lock:
+            if key in self._entries:
+                return True
+        path = self._disk_path(key)
+        return path is not None and os.path.exists(path)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+    
+    def pin(self, key):
+        """固定条目，使其不被淘汰（可重复固定，按次数计）"""
+        with self._lock:
+            self._pins[key] += 1
+    
+    def unpin(self, key):
+        """取消一次固定；不再被固定的条目恢复参与LRU淘汰"""
+        with self._lock:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                del self._pins[key]
+                self._evict()
+    
+    def is_pinned(self, key):
+        with self._lock:
+            return self._pins[key] > 0
+
+    def _store(self, key, value, size):
+        """放入内存层并按LRU淘汰到字节预算以内（最新条目始终保留）"""
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self._total_bytes += size
+            self._evict(keep=key)
+    
+    def _evict(self, keep=None):
+        """从最久未使用的条目开始淘汰，跳过被固定的条目（调用方需持有锁）"""
+        for key in list(self._entries):
+            if self._total_bytes <= self.max_bytes:
+                break
+            if key == keep or self._pins[key] > 0:
+                continue
+            self._total_bytes -= self._entries.pop(key)[1]
+
+    def _disk_path(self, key):
+        if not self.disk_dir:
+            return None
+        return os.path.join(self.disk_dir, f"{key}.pkl")
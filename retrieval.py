@@ -0,0 +1,110 @@
+import json
+import math
+import re
+from collections import Counter, defaultdict
+import numpy as np
+from data_processor import to_frame
+
+# 连续的中文字符片段 / 英文数字词
+CJK_PATTERN = re.compile(r'[\u4e00-\u9fff]+')
+WORD_PATTERN = re.compile(r'[A-Za-z0-9]+(?:\.[0-9]+)?')
+
+
+def tokenize(text):
+    """切分检索词：中文按字二元组切分（单字片段保留单字），英文数字按词切分"""
+    tokens = [word.lower() for word in WORD_PATTERN.findall(text)]
+    for segment in CJK_PATTERN.findall(text):
+        if len(segment) == 1:
+            tokens.append(segment)
+        else:
+            tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return tokens
+
+
+def estimate_tokens(text):
+    """粗略估算文本的token数：中文约0.6 token/字，其余字符约0.3 token/字符"""
+    cjk_chars = sum(len(segment) for segment in CJK_PATTERN.findall(text))
+    return math.ceil(cjk_chars * 0.6 + (len(text) - cjk_chars) * 0.3)
+
+
+def pack_records(records, token_budget):
+    """按顺序将记录序列化，直到达到token预算，返回（JSON文本，打包条数）"""
+    packed = []
+    used_tokens = 2  # 方括号
+    for record in records:
+        text = json.dumps(record, ensure_ascii=False)
+        cost = estimate_tokens(text) + 1  # 分隔逗号
+        if used_tokens + cost > token_budget:
+            break
+        packed.append(text)
+        used_tokens += cost
+    return '[' + ','.join(packed) + ']', len(packed)
+
+
+class RetrievalIndex:
+    """json2文本字段上的BM25倒排索引，每个数据集构建一次"""
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, data):
+        self.data = data
+        frame = to_frame(data)
+        texts = self._row_texts(frame)
+
+        postings = defaultdict(lambda: ([], []))
+        doc_lengths = np.zeros(len(texts), dtype=np.float64)
+        # 相同文本只切分一次（诊断等字段大量重复）
+        token_cache = {}
+        for doc_id, text in enumerate(texts):
+            counts = token_cache.get(text)
+            if counts is None:
+                counts = token_cache[text] = Counter(tokenize(text))
+            doc_lengths[doc_id] = sum(counts.values())
+            for term, tf in counts.items():
+                doc_ids, tfs = postings[term]
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = doc_lengths.mean() if len(doc_lengths) else 0.0
+        self.postings = {
+            term: (np.asarray(doc_ids, dtype=np.int64), np.asarray(tfs, dtype=np.float64))
+            for term, (doc_ids, tfs) in postings.items()
+        }
+
+    @staticmethod
+    def _row_texts(frame):
+        """将每行的文本字段拼接为一个检索文档"""
+        if frame.shape[1] == 0:
+            return [''] * len(frame)
+        combined = None
+        for column in frame.columns:
+            values = frame[column].astype(object).where(frame[column].notna(), '').astype(str)
+            combined = values if combined is None else combined + ' ' + values
+        return combined.tolist()
+
+    def search(self, query, top_k):
+        """返回与问题最相关的记录下标（按BM25得分降序）"""
+        num_docs = len(self.doc_lengths)
+        if num_docs == 0:
+            return []
+        scores = np.zeros(num_docs, dtype=np.float64)
+        length_norm = self.K1 * (1 - self.B + self.B * self.doc_lengths / max(self.avg_doc_length, 1e-9))
+        for term in set(tokenize(query)):
+            if term not in self.postings:
+                continue
+            doc_ids, tfs = self.postings[term]
+            idf = math.log(1 + (num_docs - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            scores[doc_ids] += idf * tfs * (self.K1 + 1) / (tfs + length_norm[doc_ids])
+
+        matched = np.flatnonzero(scores > 0)
+        if len(matched) > top_k:
+            matched = matched[np.argpartition(-scores[matched], top_k - 1)[:top_k]]
+        return matched[np.argsort(-scores[matched], kind='stable')].tolist()
+
+    def top_records(self, query, top_k):
+        """返回最相关的记录；没有匹配时退回到数据集开头的记录"""
+        doc_ids = self.search(query, top_k)
+        if not doc_ids:
+            doc_ids = range(min(top_k, len(self.doc_lengths)))
+        return [self.data[doc_id] for doc_id in doc_ids]
@@ -0,0 +1,224 @@
+"""时间维度分析：识别日期列并一次性解析为datetime64，在按时间排序的索引上按日/周/月聚合
+
+按日聚合的结果（记录数、各数值列的和与非空计数）可直接相加合并，
+周、月粒度及滚动均值均由日聚合推导，因此增量分析只需保存日聚合。
+"""
+
+import numpy as np
+import pandas as pd
+from data_processor import RecordView, to_frame, is_text_column
+from config import TEMPORAL_SAMPLE_SIZE, TEMPORAL_MIN_PARSE_RATIO, TEMPORAL_ROLLING_WINDOW
+
+# 列名中包含这些词时按日期列识别（可使用无分隔符的日期格式）
+DATE_NAME_HINTS = ('日期', '时间', 'date', 'time')
+# 依次尝试的日期格式
+DATE_FORMATS = ['%Y-%m-%d', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S', '%Y/%m/%d %H:%M:%S',
+                '%Y-%m-%d %H:%M', '%Y/%m/%d %H:%M', '%Y年%m月%d日', '%Y.%m.%d']
+# 无分隔符的格式容易与编号混淆，只用于列名提示为日期的列
+COMPACT_DATE_FORMATS = ['%Y%m%d', '%Y%m%d%H%M%S']
+# 聚合粒度对应的pandas频率（周以周一为起点，月以每月1日为起点）
+FREQUENCIES = {'D': 'D', 'W': 'W-MON', 'M': 'MS'}
+FREQUENCY_LABELS = {'D': '日', 'W': '周', 'M': '月'}
+
+
+def _is_date_name(column):
+    name = str(column).lower()
+    return any(hint in name for hint in DATE_NAME_HINTS)
+
+
+def infer_date_format(values, compact=False):
+    """在样本上逐个尝试候选格式，返回解析成功比例最高且达到阈值的格式，无法识别时返回None"""
+    sample = pd.Series(values[:TEMPORAL_SAMPLE_SIZE]).astype(str)
+    if sample.empty:
+        return None
+    best_format, best_ratio = None, 0.0
+    for fmt in DATE_FORMATS + (COMPACT_DATE_FORMATS if compact else []):
+        ratio = pd.to_datetime(sample, format=fmt, errors='coerce').notna().mean()
+        if ratio > best_ratio:
+            best_format, best_ratio = fmt, ratio
+            if ratio == 1.0:
+                break
+    return best_format if best_ratio >= TEMPORAL_MIN_PARSE_RATIO else None
+
+
+def parse_dates(series, fmt):
+    """按给定格式向量化解析为datetime64[s]（无法解析的值为NaT）；分类列只解析各取值一次"""
+    if fmt is None:
+        return series.to_numpy().astype('datetime64[s]')
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        parsed = pd.to_datetime(series.cat.categories.astype(str), format=fmt, errors='coerce')
+        parsed = parsed.to_numpy().astype('datetime64[s]')
+        codes = series.cat.codes.to_numpy()
+        return np.where(codes >= 0, parsed[codes], np.datetime64('NaT', 's'))
+    return pd.to_datetime(series, format=fmt, errors='coerce').to_numpy().astype('datetime64[s]')
+
+
+def detect_date_columns(df):
+    """识别日期列，返回 {列名: 日期格式}（已是datetime类型的列格式为None）"""
+    formats = {}
+    for column in df.columns:
+        series = df[column]
+        if pd.api.types.is_datetime64_any_dtype(series.dtype):
+            formats[column] = None
+        elif is_text_column(series):
+            # 分类列只需检查各取值
+            values = series.cat.categories if isinstance(series.dtype, pd.CategoricalDtype) else series.dropna()
+            fmt = infer_date_format(values, compact=_is_date_name(column))
+            if fmt is not None:
+                formats[column] = fmt
+    return formats
+
+
+def _bucket_starts(times, freq):
+    """各时间点所在日/周/月的起点"""
+    days = times.astype('datetime64[D]')
+    if freq == 'W':
+        # 1970-01-01为周四，偏移3天后对7取余即为距本周一的天数
+        days = days - (days.astype(np.int64) + 3) % 7
+    elif freq == 'M':
+        days = times.astype('datetime64[M]').astype('datetime64[D]')
+    return days.astype('datetime64[s]')
+
+
+class TemporalAggregate:
+    """按时间分桶的可合并汇总：每桶的记录数、各数值列的和与非空计数"""
+
+    def __init__(self, freq, counts, sums, value_counts):
+        self.freq = freq
+        self.counts = counts  # Series：桶起点 → 记录数
+        self.sums = sums  # DataFrame：桶起点 × 数值列
+        self.value_counts = value_counts
+
+    @classmethod
+    def empty(cls, columns, freq='D'):
+        index = pd.DatetimeIndex([], dtype='datetime64[s]')
+        return cls(freq, pd.Series(0, index=index, dtype=np.int64),
+                   pd.DataFrame(0.0, index=index, columns=columns),
+                   pd.DataFrame(0, index=index, columns=columns, dtype=np.int64))
+
+    def merge(self, other):
+        """合并另一份同粒度的汇总（按桶起点和列名对齐），返回新的汇总"""
+        return TemporalAggregate(
+            self.freq,
+            self.counts.add(other.counts, fill_value=0).astype(np.int64),
+            self.sums.add(other.sums, fill_value=0).fillna(0.0),
+            self.value_counts.add(other.value_counts, fill_value=0).fillna(0).astype(np.int64)
+        )
+
+    def coarsen(self, freq):
+        """由日聚合推导周/月聚合"""
+        keys = _bucket_starts(self.counts.index.to_numpy(), freq)
+        return TemporalAggregate(freq, self.counts.groupby(keys).sum(),
+                                 self.sums.groupby(keys).sum(), self.value_counts.groupby(keys).sum())
+
+    def means(self):
+        """每桶各数值列的均值"""
+        return self.sums / self.value_counts.where(self.value_counts > 0)
+
+    def rolling_means(self, window=TEMPORAL_ROLLING_WINDOW):
+        """连续日历周期上的滚动均值（没有记录的周期也计入窗口长度）"""
+        if self.counts.empty:
+            return self.means()
+        periods = pd.date_range(self.counts.index.min(), self.counts.index.max(),
+                                freq=FREQUENCIES[self.freq], unit='s')
+        sums = self.sums.reindex(periods, fill_value=0.0).rolling(window, min_periods=1).sum()
+        counts = self.value_counts.reindex(periods, fill_value=0).rolling(window, min_periods=1).sum()
+        return sums / counts.where(counts > 0)
+
+
+class TimeIndex:
+    """单个日期列的时间索引：按时间排序的行号与时间，各粒度的聚合结果按需计算并缓存
+
+    frame为数据集的数值DataFrame（行序与日期列一致），只保存引用，聚合时逐列取值，不另存数值副本。
+    """
+
+    def __init__(self, times, frame, columns, fmt=None):
+        self._valid = ~np.isnat(times)
+        rows = np.flatnonzero(self._valid)
+        order = np.argsort(times[rows], kind='stable')
+        self.format = fmt
+        self.missing = int(len(times) - len(rows))
+        self.rows = rows[order]
+        self.times = times[self.rows]
+        self.columns = list(columns)
+        self._source_times = times
+        self._frame = frame
+        self._aggregates = {}
+
+    def __len__(self):
+        return len(self.times)
+
+    def between(self, start, end):
+        """时间落在 [start, end] 内的行号（按时间排序）"""
+        lower = np.searchsorted(self.times, np.datetime64(start, 's'), side='left')
+        upper = np.searchsorted(self.times, np.datetime64(end, 's'), side='right')
+        return self.rows[lower:upper]
+
+    def aggregate(self, freq='D'):
+        """按日（D）、周（W）或月（M）聚合"""
+        if freq not in self._aggregates:
+            self._aggregates[freq] = self._daily() if freq == 'D' else self.aggregate('D').coarsen(freq)
+        return self._aggregates[freq]
+
+    def _daily(self):
+        """按距最早日期的天数分桶计数求和（保持原始行序，无需按排序结果重排数值列）"""
+        if len(self.times) == 0:
+            return TemporalAggregate.empty(self.columns)
+        first_day = self.times[0].astype('datetime64[D]')
+        bins = (self._source_times[self._valid].astype('datetime64[D]') - first_day).astype(np.int64)
+        counts = np.bincount(bins)
+        occupied = np.flatnonzero(counts)
+        index = pd.DatetimeIndex((first_day + occupied).astype('datetime64[s]'))
+
+        sums = np.empty((len(occupied), len(self.columns)))
+        value_counts = np.empty((len(occupied), len(self.columns)), dtype=np.int64)
+        for j, name in enumerate(self.columns):
+            # 按列转换为float64，任一时刻只有一列的临时副本
+            column = self._frame[name].to_numpy(dtype=np.float64, na_value=np.nan)[self._valid]
+            present = ~np.isnan(column)
+            sums[:, j] = np.bincount(bins, weights=np.where(present, column, 0.0), minlength=len(counts))[occupied]
+            value_counts[:, j] = np.bincount(bins, weights=present, minlength=len(counts))[occupied]
+        return TemporalAggregate(
+            'D',
+            pd.Series(counts[occupied], index=index),
+            pd.DataFrame(sums, index=index, columns=self.columns),
+            pd.DataFrame(value_counts, index=index, columns=self.columns)
+        )
+
+
+def build_time_indexes(json1, json2):
+    """识别json2中的日期列并解析，以json1的数值列构建各日期列的时间索引"""
+    text_df = to_frame(json2)
+    formats = detect_date_columns(text_df)
+    if not formats:
+        return {}
+    # 各日期列的索引共享数据集的数值DataFrame，聚合时按需取列
+    numeric_frame = to_frame(json1)
+    numeric_columns = numeric_frame.select_dtypes(include=[np.number]).columns
+    return {
+        column: TimeIndex(parse_dates(text_df[column], fmt), numeric_frame, numeric_columns, fmt)
+        for column, fmt in formats.items()
+    }
+
+
+def get_time_indexes(json1, json2):
+    """获取数据集各日期列的时间索引；记录视图上缓存，同一数据集的日期只解析一次"""
+    if isinstance(json2, RecordView):
+        return json2.cached('time_indexes', lambda frame: build_time_indexes(json1, frame))
+    return build_time_indexes(json1, json2)
+
+
+def summarize_trend(daily):
+    """由日聚合生成时间趋势摘要：起止日期、跨度天数、记录数及每月记录数"""
+    counts = daily.counts
+    if counts.empty:
+        return {'min_date': None, 'max_date': None, 'date_range': 0, 'records': 0, 'monthly_counts': {}}
+    min_date, max_date = counts.index.min(), counts.index.max()
+    return {
+        'min_date': min_date.strftime('%Y-%m-%d'),
+        'max_date': max_date.strftime('%Y-%m-%d'),
+        'date_range': int((max_date - min_date).days),
+        'records': int(counts.sum()),
+        'monthly_counts': {period.strftime('%Y-%m'): int(count)
+                           for period, count in daily.coarsen('M').counts.items()}
+    }